@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+from Labyrinth.labyrinth import *
+from Labyrinth.utils import PriorityQueue
+import math, timeit
+
+def random_board(seed):
+    random.seed(seed)
+    lab = Labyrinth(RuleSet(), [Player(colour) for colour in all_player_colours])
+    return lab.gameboard
+
+def report(name, func, calls, number):
+    """Print the best average time of a single call out of three runs"""
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / (number * calls)
+    print("{:<32} {:>10.1f} us".format(name, seconds * 1e6))
+
+def bench_slide(boards):
+    slides = [(b, random.choice([m for m in TileMovement.all_moves() if m != b.last_slide]))
+              for b in boards]
+
+    def run():
+        for board, direction in slides:
+            board.slide_tiles(direction, 90)
+
+    report("slide_tiles", run, len(slides), 100)
+    GameBoard.DEBUG = True
+    report("slide_tiles (DEBUG)", run, len(slides), 100)
+    GameBoard.DEBUG = False
+
+def bench_components(boards):
+    slides = [(b, random.choice([m for m in TileMovement.all_moves() if m != b.last_slide])) for b in boards]
+
+    def run():
+        for board, direction in slides:
+            undo = board.apply_slide(direction, 90)
+            board.components
+            board.undo(undo)
+
+    report("components after slide", run, len(slides), 100)
+
+def reference_shortest_path_to_closest(board, start, end):
+    """The A* shortest_path_to_closest used before the BFS, kept to compare against"""
+    class FakePlayer(object):
+        pass
+
+    def heuristic(p):
+        x, y = p
+        end_x, end_y = end
+        return abs(end_x - x) + abs(end_y - y)
+
+    frontier = PriorityQueue()
+    frontier.push((start, 0, None), heuristic(start))
+    visited = set()
+    shortest_links = set()
+
+    # Explore until no more
+    while not frontier.empty():
+        (point, cost, prev) = frontier.pop()
+        if point not in visited:
+            visited.add(point)
+            shortest_links.add((point, cost, prev))
+
+            # Create a fake player to move
+            x, y = point
+            fake_player = FakePlayer()
+            fake_player.cards = []
+
+            # Add all children
+            for m in PlayerMovement.all_moves():
+                fake_player.x = x
+                fake_player.y = y
+                if PlayerMovement.move(m, board._board, fake_player):
+                    new_pos = (fake_player.x, fake_player.y)
+                    new_cost = cost + 1
+                    frontier.push((new_pos, new_cost, point), new_cost + heuristic(new_pos))
+
+    # Work out closest visited to target
+    best_link = None
+    best_heuristic = math.inf
+    for link in shortest_links:
+        point, _, _ = link
+        h = heuristic(point)
+        if h < best_heuristic:
+            best_link = link
+            best_heuristic = h
+
+    # Find the reversed path
+    final_target, _, prev = best_link
+    target = final_target
+    rev_path = [target]
+    while prev is not None:
+        def match_link(i):
+            (t, _, p) = i
+            return t == prev
+        # Find the prev link
+        prev_link = list(filter(match_link, list(shortest_links)))
+        assert(len(prev_link) == 1)
+        target, _, prev = prev_link[0]
+        rev_path.append(target)
+
+    # Convert the coord-path to a move path
+    path = list(reversed(rev_path))[1:]
+    last_x, last_y = start
+    move_path = []
+    while path != []:
+        next_x, next_y = path[0]
+        path = path[1:]
+        if last_x + 1 == next_x:
+            move_path.append(PlayerMovement.RIGHT)
+        elif last_x - 1 == next_x:
+            move_path.append(PlayerMovement.LEFT)
+        elif last_y + 1 == next_y:
+            move_path.append(PlayerMovement.DOWN)
+        elif last_y - 1 == next_y:
+            move_path.append(PlayerMovement.UP)
+        last_x = next_x
+        last_y = next_y
+
+    return final_target, move_path
+
+def bench_pathfinding(boards):
+    queries = [(board, (random.randrange(7), random.randrange(7)), (random.randrange(7), random.randrange(7)))
+               for board in boards for _ in range(10)]
+
+    # Both find a cell as close to the end, the BFS breaks ties by the shorter path
+    def closeness(result, end):
+        (x, y), path = result
+        return abs(end[0] - x) + abs(end[1] - y), len(path)
+    for board, start, end in queries:
+        distance, steps = closeness(board.shortest_path_to_closest(start, end), end)
+        reference_distance, reference_steps = closeness(reference_shortest_path_to_closest(board, start, end), end)
+        assert(distance == reference_distance and steps <= reference_steps)
+
+    def run(pathfinder):
+        for board, start, end in queries:
+            pathfinder(board, start, end)
+
+    report("shortest_path_to_closest (A*)", lambda: run(reference_shortest_path_to_closest), len(queries), 10)
+    report("shortest_path_to_closest (BFS)", lambda: run(GameBoard.shortest_path_to_closest), len(queries), 10)
+
+def bench_turn(boards):
+    def run():
+        for board in boards:
+            board.players[board.turn].one_lookahead_move(board)
+
+    report("one_lookahead_move", run, len(boards), 5)
+
+def bench_generation():
+    report("GameBoard()", lambda: GameBoard(), 1, 1000)
+    report("BoardBatch (per board)", lambda: BoardBatch(1000, seed=0), 1000, 3)
+
+def main():
+    boards = [random_board(seed) for seed in range(20)]
+    bench_slide(boards)
+    bench_components(boards)
+    bench_pathfinding(boards)
+    bench_turn(boards)
+    bench_generation()
+
+if __name__ == '__main__':
+    main()
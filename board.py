@@ -3,129 +3,466 @@ import copy
 import random
 from itertools import product
 
+try:
+    import numpy as np
+except ImportError: # numpy is only needed for the vectorised engine
+    np = None
+
 from Labyrinth.tile import *
 from Labyrinth.player import all_player_colours, Player, PlayerMovement
-from Labyrinth.utils import PriorityQueue
 
 all_tokens = set(["genie", "skull", "sword", "scarab", "beetle", "rat",
                            "dragonfly", "gold", "keys", "gem", "lizard", "helmet",
                            "princess", "book", "crown", "treasure", "candlestick",
                            "ghost", "spider", "owl", "map", "ring", "man", "bat"])
 
-class GameBoard:
-    def __init__(self, players=[], dynamic_placement=None):
-        def static_tile(tile, rotation=0, token=None):
+# Token ids used by the compact board representation, 0 means no token
+token_names = [None] + sorted(all_tokens) + [c + " base" for c in all_player_colours]
+token_ids = {name: i for i, name in enumerate(token_names)}
+
+# Cells are stored row-major (index = y * 7 + x) with the floating tile last
+FLOATING = 49
+fixed_cells = frozenset(y * 7 + x for x in range(0, 7, 2) for y in range(0, 7, 2))
+
+def _slide_line(direction):
+    """Cell indices of a slide, ordered from the insertion edge to the far edge"""
+    edge, row = direction
+    if edge == TileMovement.T or edge == TileMovement.B:
+        offset = 1 if row == TileMovement.L else (
+                 3 if row == TileMovement.M else 5)
+        line = [offset + 7 * y for y in range(7)]
+        return tuple(line if edge == TileMovement.T else reversed(line))
+    else:
+        offset = (row * 2) + 1
+        line = [offset * 7 + x for x in range(7)]
+        return tuple(line if edge == TileMovement.L else reversed(line))
+
+slide_lines = {direction: _slide_line(direction) for direction in slide_moves}
+
+def _cell_neighbours(cell):
+    """Neighbours of a cell as (cell, edge leaving this cell, edge entering the neighbour)"""
+    x, y = cell % 7, cell // 7
+    neighbours = []
+    if y > 0:
+        neighbours.append((cell - 7, NORTH_BIT, SOUTH_BIT))
+    if x < 6:
+        neighbours.append((cell + 1, EAST_BIT, WEST_BIT))
+    if y < 6:
+        neighbours.append((cell + 7, SOUTH_BIT, NORTH_BIT))
+    if x > 0:
+        neighbours.append((cell - 1, WEST_BIT, EAST_BIT))
+    return tuple(neighbours)
+
+cell_neighbours = [_cell_neighbours(cell) for cell in range(49)]
+
+# Player movement between neighbouring cells, keyed by the change in cell index
+cell_steps = {-7: PlayerMovement.UP, 1: PlayerMovement.RIGHT, 7: PlayerMovement.DOWN, -1: PlayerMovement.LEFT}
+
+# Cells whose links can change when a line is slid, the line and its neighbours
+slide_regions = {direction: frozenset(line).union(n for cell in line for n, _, _ in cell_neighbours[cell])
+                 for direction, line in slide_lines.items()}
+
+# Where everything on the board ends up after a slide, indexed by the old cell. Tokens
+# pushed off the end become floating while players wrap around to the start of the line
+def _slide_cell_map(line, wrap):
+    cells = list(range(50))
+    for i, cell in enumerate(line[:-1]):
+        cells[cell] = line[i + 1]
+    cells[line[-1]] = line[0] if wrap else FLOATING
+    cells[FLOATING] = line[0]
+    return cells
+
+slide_token_cells = {direction: _slide_cell_map(line, False) for direction, line in slide_lines.items()}
+slide_player_cells = {direction: _slide_cell_map(line, True) for direction, line in slide_lines.items()}
+
+def label_components(edges):
+    """Label the connected component of every cell by flood fill, numbering them from 0"""
+    labels = bytearray(b"\xff" * 49)
+    label = -1
+    for seed in range(49):
+        if labels[seed] != 0xff:
+            continue
+        label += 1
+        labels[seed] = label
+        stack = [seed]
+        while stack:
+            cell = stack.pop()
+            for neighbour, out_edge, in_edge in cell_neighbours[cell]:
+                if (labels[neighbour] == 0xff and edges[cell] & out_edge
+                        and edges[neighbour] & in_edge):
+                    labels[neighbour] = label
+                    stack.append(neighbour)
+    return labels
+
+# Zobrist keys, generated from a fixed seed so hashes are stable between runs
+_zobrist_random = random.Random(0x1AB)
+def _zobrist_keys(n):
+    return [_zobrist_random.getrandbits(64) for _ in range(n)]
+zobrist_edges = [_zobrist_keys(16) for cell in range(50)]
+zobrist_tokens = [[0] + _zobrist_keys(len(token_names) - 1) for cell in range(50)]
+zobrist_slides = dict(zip([None] + sorted(slide_lines), [0] + _zobrist_keys(len(slide_lines))))
+zobrist_turns = dict(zip([None] + list(range(len(all_player_colours))), [0] + _zobrist_keys(len(all_player_colours))))
+zobrist_positions = {c: _zobrist_keys(49) for c in all_player_colours}
+# Cards are hashed as a set, in order play only ever removes the first card
+zobrist_cards = {c: [0] + _zobrist_keys(len(token_names) - 1) for c in all_player_colours}
+
+# Tiles that never move as (x, y, tile type, rotation, token)
+static_tiles = [
+    # Player bases
+    (0, 0, CornerTile, 90,  "red base"),
+    (6, 0, CornerTile, 180, "blue base"),
+    (6, 6, CornerTile, 270, "green base"),
+    (0, 6, CornerTile, 0,   "yellow base"),
+
+    # Outside static tiles
+    (2, 0, TriTile, 180, "skull"),
+    (4, 0, TriTile, 180, "sword"),
+    (0, 2, TriTile, 90,  "gold"),
+    (0, 4, TriTile, 90,  "book"),
+    (2, 6, TriTile, 0,   "map"),
+    (4, 6, TriTile, 0,   "ring"),
+    (6, 2, TriTile, 270, "helmet"),
+    (6, 4, TriTile, 270, "candlestick"),
+
+    # Inside static tiles
+    (2, 2, TriTile, 90,  "keys"),
+    (4, 2, TriTile, 180, "gem"),
+    (2, 4, TriTile, 0,   "crown"),
+    (4, 4, TriTile, 270, "treasure"),
+]
+
+# Tiles that get shuffled onto the board as (tile type, token)
+dynamic_tiles = ([(CornerTile, t) for t in ["scarab", "beetle", "rat", "dragonfly", "spider", "owl"]]
+                 + [(CornerTile, None)] * 10
+                 + [(TriTile, t) for t in ["genie", "lizard", "princess", "ghost", "man", "bat"]]
+                 + [(StraightTile, None)] * 12)
+
+movable_cells = [cell for cell in range(49) if cell not in fixed_cells]
+
+_static_edges = bytearray(50)
+_static_tokens = bytearray(50)
+for x, y, tile_type, rotation, token in static_tiles:
+    _static_edges[y * 7 + x] = shape_rotation_edges[tile_type.SHAPE * 4 + rotation // 90]
+    _static_tokens[y * 7 + x] = token_ids[token]
+
+def random_tiles(rng=random, dynamic_placement=None):
+    """Edge masks and token ids of a random starting board
+
+    dynamic_placement(empty_coords, tile) can choose where each shuffled tile goes, it
+    returns ((x, y), rotation). By default each tile gets a random cell and rotation."""
+    edges = bytearray(_static_edges)
+    tokens = bytearray(_static_tokens)
+    tiles = list(dynamic_tiles)
+    rng.shuffle(tiles)
+
+    if dynamic_placement is None:
+        # The tiles are already shuffled, so fill the cells in order with random rotations
+        rotations = rng.choices(range(4), k=len(movable_cells))
+        for cell, (tile_type, token), rotation in zip(movable_cells, tiles, rotations):
+            edges[cell] = shape_rotation_edges[tile_type.SHAPE * 4 + rotation]
+            tokens[cell] = token_ids[token]
+    else:
+        empty_coords = [(cell % 7, cell // 7) for cell in movable_cells]
+        for tile_type, token in tiles[:len(movable_cells)]:
+            tile = tile_type()
             tile.token = token
-            tile.rotate(rotation)
-            tile.can_move = False
-            return tile
+            (x, y), theta = dynamic_placement(list(empty_coords), tile)
+            assert(0 <= x < 7 and 0 <= y < 7 and theta in [0, 90, 180, 270])
+            empty_coords.remove((x, y))
+            edges[y * 7 + x] = shape_rotation_edges[tile_type.SHAPE * 4 + theta // 90]
+            tokens[y * 7 + x] = token_ids[token]
+
+    # The one tile left over is floating
+    assert(len(tiles) == len(movable_cells) + 1)
+    tile_type, token = tiles[-1]
+    edges[FLOATING] = shape_edges[tile_type.SHAPE]
+    tokens[FLOATING] = token_ids[token]
+    return edges, tokens
+
+class BoardBatch:
+    """Random starting boards packed one after another into flat buffers of 50 bytes each"""
+    def __init__(self, n, seed=None, dynamic_placement=None):
+        rng = random.Random(seed)
+        self.edges = bytearray()
+        self.tokens = bytearray()
+        for _ in range(n):
+            edges, tokens = random_tiles(rng, dynamic_placement)
+            self.edges += edges
+            self.tokens += tokens
+
+    def __len__(self):
+        return len(self.edges) // 50
+
+    def board(self, i, players=[]):
+        """The i-th board as a regular GameBoard"""
+        assert(0 <= i < len(self))
+        return GameBoard.from_arrays(self.edges[i * 50:(i + 1) * 50],
+                                     self.tokens[i * 50:(i + 1) * 50], players)
+
+    def arrays(self):
+        """Edge masks and token ids as (n, 50) numpy arrays sharing the buffers"""
+        if np is None:
+            raise ImportError("numpy is required for BoardBatch.arrays")
+        return (np.frombuffer(self.edges, dtype=np.uint8).reshape(-1, 50),
+                np.frombuffer(self.tokens, dtype=np.uint8).reshape(-1, 50))
+
+edge_bits = None if np is None else np.array([NORTH_BIT, EAST_BIT, SOUTH_BIT, WEST_BIT], dtype=np.uint8)
+
+def mask_planes(masks):
+    """Boolean array of the open NORTH, EAST, SOUTH and WEST edges of an array of edge masks
+
+    The edges are a new first axis, so (B, 50) masks of B boards give a (4, B, 50) array."""
+    if np is None:
+        raise ImportError("numpy is required for the vectorised board engine")
+    masks = np.asarray(masks, dtype=np.uint8)
+    return (masks[None] & edge_bits.reshape((4,) + (1,) * masks.ndim)) != 0
+
+def edge_planes(edges):
+    """Boolean (4, 7, 7) array of the open NORTH, EAST, SOUTH and WEST edges, indexed [y, x]"""
+    if np is None:
+        raise ImportError("numpy is required for the vectorised board engine")
+    return mask_planes(np.frombuffer(bytes(edges[:FLOATING]), dtype=np.uint8).reshape(7, 7))
+
+def open_links(planes):
+    """Links between neighbours, east[y, x] joins (x, y) to (x + 1, y) and south[y, x] joins (x, y) to (x, y + 1)"""
+    north, east, south, west = planes
+    return east[:, :-1] & west[:, 1:], south[:-1, :] & north[1:, :]
+
+def reachable_array(planes, start):
+    """Boolean (7, 7) array of the cells reachable from start by repeated dilation"""
+    east_links, south_links = open_links(planes)
+    x, y = start
+    reached = np.zeros((7, 7), dtype=bool)
+    reached[y, x] = True
+    while True:
+        grown = reached.copy()
+        grown[:, 1:] |= reached[:, :-1] & east_links
+        grown[:, :-1] |= reached[:, 1:] & east_links
+        grown[1:, :] |= reached[:-1, :] & south_links
+        grown[:-1, :] |= reached[1:, :] & south_links
+        if (grown == reached).all():
+            return reached
+        reached = grown
+
+_tile_flyweights = {}
 
-        def random_placement(empty_coords, tile):
-            return (random.choice(empty_coords), random.choice([0, 90, 180, 270]))
-
-        if dynamic_placement is None:
-            dynamic_placement = random_placement
+class GameBoard:
+    # Run the full is_valid check after every slide, useful when debugging
+    DEBUG = False
 
+    def __init__(self, players=[], dynamic_placement=None):
+        edges, tokens = random_tiles(random, dynamic_placement)
+        self._setup(edges, tokens, players)
+
+    @classmethod
+    def from_arrays(cls, edges, tokens, players=[]):
+        """Create a starting board from 50 edge masks and 50 token ids, the floating tile last"""
+        board = cls.__new__(cls)
+        board._setup(bytearray(edges), bytearray(tokens), players)
+        return board
+
+    def _setup(self, edges, tokens, players):
+        assert(len(edges) == 50 and len(tokens) == 50)
         self.turn = 0
-
-        # Create an empty board
-        self._board = [[None for x in range(7)] for y in range(7)]
-
-        # Add in the player bases
-        self._board[0][0] = static_tile(CornerTile(), 90,  "red base")
-        self._board[0][6] = static_tile(CornerTile(), 180, "blue base")
-        self._board[6][6] = static_tile(CornerTile(), 270, "green base")
-        self._board[6][0] = static_tile(CornerTile(), 0,   "yellow base")
-
-        # Add in outside static tiles
-        self._board[0][2] = static_tile(TriTile(), 180, "skull")
-        self._board[0][4] = static_tile(TriTile(), 180, "sword")
-        self._board[2][0] = static_tile(TriTile(), 90,  "gold")
-        self._board[4][0] = static_tile(TriTile(), 90,  "book")
-        self._board[6][2] = static_tile(TriTile(), 0,   "map")
-        self._board[6][4] = static_tile(TriTile(), 0,   "ring")
-        self._board[2][6] = static_tile(TriTile(), 270, "helmet")
-        self._board[4][6] = static_tile(TriTile(), 270, "candlestick")
-
-        # Add in inside static tiles
-        self._board[2][2] = static_tile(TriTile(), 90,  "keys")
-        self._board[2][4] = static_tile(TriTile(), 180, "gem")
-        self._board[4][2] = static_tile(TriTile(), 0,   "crown")
-        self._board[4][4] = static_tile(TriTile(), 270, "treasure")
-
-        # Create set of dynamic tiles
-        dynamic_tiles = list(batch_create_tiles(CornerTile, 16,
-                        ["scarab", "beetle", "rat", "dragonfly", "spider", "owl"]).union(
-                            batch_create_tiles(TriTile, 6,
-                            ["genie", "lizard", "princess", "ghost", "man", "bat"])).union(
-                                batch_create_tiles(StraightTile, 12, [])
-                                ))
-        random.shuffle(dynamic_tiles)
-        for tile in dynamic_tiles:
-            empty_coords = [(x, y) for x, y, t in self.iterate() if not t]
-            if empty_coords != []:
-                (x, y), theta = dynamic_placement(empty_coords, tile)
-                assert(0 <= x < 7 and 0 <= y < 7 and theta in [0, 90, 180, 270])
-                assert(not self._board[y][x])
-                tile.rotate(theta)
-                self._board[y][x] = tile
-            elif not hasattr(self, "floating_tile"):
-                self.floating_tile = tile
-                self.last_slide = None
-            else:
-                assert(False) # For some reason we have 2 (or more) tiles floating
+        self.last_slide = None
+        self._edges = edges
+        self._tokens = tokens
+        self._grid = None
+        self._hash = self._tiles_hash()
+        self._components = None
+        self._token_cells = bytearray(len(token_names))
+        for cell, token in enumerate(self._tokens):
+            self._token_cells[token] = cell
 
         # Add all the players to the board
         self.players = []
         for player in players:
-            for x, y, tile in self.iterate():
-                if tile and tile.token == player.colour + " base":
-                    player.home_x = x
-                    player.home_y = y
-                    player.x = x
-                    player.y = y
-                    break
+            cell = self._tokens.find(token_ids[player.colour + " base"], 0, FLOATING)
+            if cell >= 0:
+                player.home_x = cell % 7
+                player.home_y = cell // 7
+                player.x = player.home_x
+                player.y = player.home_y
             self.players.append(player)
 
+    def _tiles_hash(self):
+        """Zobrist hash of the tiles and last slide, kept up to date by apply_slide"""
+        h = zobrist_slides[self.last_slide]
+        for cell in range(50):
+            h ^= zobrist_edges[cell][self._edges[cell]] ^ zobrist_tokens[cell][self._tokens[cell]]
+        return h
+
+    def __hash__(self):
+        # Players are hashed on demand as their positions are updated directly on them
+        h = self._hash ^ zobrist_turns[self.turn]
+        for p in self.players:
+            h ^= zobrist_positions[p.colour][p.y * 7 + p.x]
+            for card in p.cards:
+                h ^= zobrist_cards[p.colour][token_ids[card]]
+        return h
+
+    def __eq__(self, other):
+        if not isinstance(other, GameBoard):
+            return NotImplemented
+        return (self._edges == other._edges and self._tokens == other._tokens
+                and self.last_slide == other.last_slide and self.turn == other.turn
+                and [(p.colour, p.x, p.y, p.cards) for p in self.players]
+                    == [(p.colour, p.x, p.y, p.cards) for p in other.players])
+
+    def _tile(self, cell):
+        # Tiles are shared flyweights, one per edge mask, token and whether they can move. They
+        # are frozen as changing one would change it on every board
+        key = (self._edges[cell], self._tokens[cell], cell not in fixed_cells)
+        tile = _tile_flyweights.get(key)
+        if tile is None:
+            tile = Tile.from_edge_mask(self._edges[cell], token_names[self._tokens[cell]], key[2]).freeze()
+            _tile_flyweights[key] = tile
+        return tile
+
+    @property
+    def _board(self):
+        """Read only 7x7 grid of shared tiles built from the compact representation"""
+        if self._grid is None:
+            self._grid = [[self._tile(y * 7 + x) for x in range(7)] for y in range(7)]
+        return self._grid
+
+    @property
+    def floating_tile(self):
+        return self._tile(FLOATING)
+
     def iterate(self):
-        i = 0
-        it = iter(self._board)
         for y, row in enumerate(self._board):
             for x, tile in enumerate(row):
                 yield (x, y, tile)
 
     def find_card(self, card):
-        for x, y, tile in self.iterate():
-            if tile.token == card:
-                return x, y
-        return None
+        token = token_ids.get(card)
+        if not token or self._token_cells[token] == FLOATING:
+            return None
+        cell = self._token_cells[token]
+        return cell % 7, cell // 7
+
+    @property
+    def components(self):
+        """Connected component label of every cell, computed when first needed after a slide
+
+        A slide drops the labels and undo puts them back. Repairing just the components a
+        slide touches was tried, but they usually cover most of the board so it saved nothing."""
+        if self._components is None:
+            self._components = label_components(self._edges)
+        return self._components
+
+    def edge_planes(self):
+        """Open edges of the board as a numpy array, see edge_planes"""
+        return edge_planes(self._edges)
+
+    def reachable_array(self, start):
+        """Cells reachable from start as a numpy array, see reachable_array"""
+        return reachable_array(self.edge_planes(), start)
+
+    def slide_classes(self):
+        """Legal slide actions grouped by the board they lead to, in slide_actions order
+
+        A slide only changes the board through its line and the inserted tile, and last_slide
+        is part of the state, so two actions are equivalent exactly when they share a slide
+        and the floating tile looks the same in both orientations."""
+        return [[(slide, orientation) for orientation in group]
+                for group in orientation_classes(self._edges[FLOATING])
+                for slide in slide_moves if slide != self.last_slide]
+
+    def evaluate_slides(self, player, pool=None, chunks=None):
+        """Score every legal slide for one of the players, see SlideEvaluator
+
+        With a concurrent.futures pool the slides are split into chunks (one per slide by
+        default) and scored in the workers from the packed board, see to_bytes."""
+        if pool is None:
+            return SlideEvaluator(self, player)
+
+        slides = [slide for slide in slide_moves if slide != self.last_slide]
+        chunks = chunks or len(slides)
+        data = self.to_bytes(self.players.index(player))
+        futures = [pool.submit(_evaluate_packed_slides, data, player.ruleset, slides[i::chunks])
+                   for i in range(chunks)]
+        evaluator = SlideEvaluator(self, player, slides=[])
+        for future in futures:
+            evaluator.scores.update(future.result())
+        return evaluator
+
+    def to_bytes(self, turn=None):
+        """Pack the board and players into a few hundred bytes, see from_bytes
+
+        turn overrides the player whose turn it is. Players need a home and are packed as
+        their colour, position, home and cards."""
+        turn = self.turn if turn is None else turn
+        data = bytearray(self._edges + self._tokens)
+        data.append(0xff if turn is None else turn)
+        data.append(0xff if self.last_slide is None else slide_moves.index(self.last_slide))
+        data.append(len(self.players))
+        for p in self.players:
+            data += bytes([all_player_colours.index(p.colour), p.x, p.y, p.home_x, p.home_y, len(p.cards)])
+            data += bytes(token_ids[card] for card in p.cards)
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data, ruleset=None):
+        """Unpack a board made by to_bytes, the new players are given ruleset"""
+        board = cls.__new__(cls)
+        board._setup(bytearray(data[:50]), bytearray(data[50:100]), [])
+        board.turn = None if data[100] == 0xff else data[100]
+        board.last_slide = None if data[101] == 0xff else slide_moves[data[101]]
+        board._hash = board._tiles_hash()
+        offset = 103
+        for _ in range(data[102]):
+            colour, x, y, home_x, home_y, cards = data[offset:offset + 6]
+            player = Player(all_player_colours[colour])
+            player.x, player.y, player.home_x, player.home_y = x, y, home_x, home_y
+            player.cards = [token_names[token] for token in data[offset + 6:offset + 6 + cards]]
+            player.ruleset = ruleset
+            board.players.append(player)
+            offset += 6 + cards
+        return board
+
+    def can_reach(self, start, end):
+        components = self.components
+        return components[start[1] * 7 + start[0]] == components[end[1] * 7 + end[0]]
+
+    def reachable_cells(self, start):
+        components = self.components
+        label = components[start[1] * 7 + start[0]]
+        return [(cell % 7, cell // 7) for cell in range(49) if components[cell] == label]
+
+    def closest_reachable(self, start, end):
+        """The reachable cell closest to end and its distance, without searching for a path"""
+        end_x, end_y = end
+        if self.can_reach(start, end):
+            return tuple(end), 0
+        distances = [((x, y), abs(end_x - x) + abs(end_y - y)) for x, y in self.reachable_cells(start)]
+        return min(distances, key=lambda d: d[1])
 
     def clone(self):
-        new_board = copy.deepcopy(self)
+        new_board = copy.copy(self)
+        new_board._edges = bytearray(self._edges)
+        new_board._tokens = bytearray(self._tokens)
+        new_board._token_cells = bytearray(self._token_cells)
+        new_board.players = [p.clone() for p in self.players]
         return new_board
 
     def is_valid(self):
         """Some assertions to try an make sure the board makes sense"""
 
-        # Check that we have a floating tile
-        assert(hasattr(self, "floating_tile"))
+        # Check that we have all the tiles we are supposed to, including a floating tile
+        assert(len(self._edges) == 50 and len(self._tokens) == 50)
         found_tokens = set()
-        found_ids = set([self.floating_tile.id])
-        if self.floating_tile.token:
-            found_tokens.add(self.floating_tile.token)
 
-        for x, y, tile in self.iterate():
-            # Check all tiles have unique ids
-            assert(tile.id not in found_ids)
-            found_ids.add(tile.id)
+        for cell in range(50):
+            # Check every tile is a corner, straight or tri tile
+            assert(bin(self._edges[cell]).count("1") in [2, 3])
 
             # Check that there are no duplicate tokens on the board
-            if tile.token:
-                assert(tile.token not in found_tokens)
-                found_tokens.add(tile.token)
-
-        # Check that we have all the tiles we are supposed to
-        assert(len(found_ids) == 50)
+            token = token_names[self._tokens[cell]]
+            if token:
+                assert(token not in found_tokens)
+                found_tokens.add(token)
 
         # Check all tokens are valid
         everything = all_tokens.union(set(p + " base" for p in all_player_colours))
@@ -136,173 +473,123 @@ class GameBoard:
             assert(False)
 
 
+    def distance_map(self, start):
+        """Breadth first search from start over the flat grid, see DistanceMap"""
+        edges = self._edges
+        start_cell = start[1] * 7 + start[0]
+        distances = bytearray(b"\xff" * 49)
+        parents = bytearray(b"\xff" * 49)
+        distances[start_cell] = 0
+        parents[start_cell] = start_cell
+        order = [start_cell]
+        for cell in order:
+            for neighbour, out_edge, in_edge in cell_neighbours[cell]:
+                if (parents[neighbour] == 0xff and edges[cell] & out_edge
+                        and edges[neighbour] & in_edge):
+                    distances[neighbour] = distances[cell] + 1
+                    parents[neighbour] = cell
+                    order.append(neighbour)
+        return DistanceMap(start_cell, distances, parents, order)
+
     def shortest_path_to_closest(self, start, end):
-        class FakePlayer(object):
-            pass
-
-        def heuristic(p):
-            x, y = p
-            end_x, end_y = end
-            return abs(end_x - x) + abs(end_y - y)
-
-        frontier = PriorityQueue()
-        frontier.push((start, 0, None), heuristic(start))
-        visited = set()
-        shortest_links = set()
-
-        # Explore until no more
-        while not frontier.empty():
-            (point, cost, prev) = frontier.pop()
-            if point not in visited:
-                visited.add(point)
-                shortest_links.add((point, cost, prev))
-
-                # Create a fake player to move
-                x, y = point
-                fake_player = FakePlayer()
-                fake_player.cards = []
-
-                # Add all children
-                for m in PlayerMovement.all_moves():
-                    fake_player.x = x
-                    fake_player.y = y
-                    if PlayerMovement.move(m, self._board, fake_player):
-                        new_pos = (fake_player.x, fake_player.y)
-                        new_cost = cost + 1
-                        frontier.push((new_pos, new_cost, point), new_cost + heuristic(new_pos))
-
-        # Work out closest visited to target
-        best_link = None
-        best_heuristic = math.inf
-        for link in shortest_links:
-            point, _, _ = link
-            h = heuristic(point)
-            if h < best_heuristic:
-                best_link = link
-                best_heuristic = h
-
-        # Find the reversed path
-        final_target, _, prev = best_link
-        target = final_target
-        rev_path = [target]
-        while prev is not None:
-            def match_link(i):
-                (t, _, p) = i
-                return t == prev
-            # Find the prev link
-            prev_link = list(filter(match_link, list(shortest_links)))
-            assert(len(prev_link) == 1)
-            target, _, prev = prev_link[0]
-            rev_path.append(target)
-
-        # Convert the coord-path to a move path
-        path = list(reversed(rev_path))[1:]
-        coord_path = path
-        last_x, last_y = start
-        move_path = []
-        while path != []:
-            next_x, next_y = path[0]
-            path = path[1:]
-            if last_x + 1 == next_x:
-                move_path.append(PlayerMovement.RIGHT)
-            elif last_x - 1 == next_x:
-                move_path.append(PlayerMovement.LEFT)
-            elif last_y + 1 == next_y:
-                move_path.append(PlayerMovement.DOWN)
-            elif last_y - 1 == next_y:
-                move_path.append(PlayerMovement.UP)
-            last_x = next_x
-            last_y = next_y
-
-        #print("target: {}; coord_path: {}; move_path: {}".format(final_target, coord_path, move_path))
-        return final_target, move_path # Closest End Coord, Path
+        distances = self.distance_map(start)
+        closest_end = distances.closest_to(end)
+        return closest_end, distances.path_to(closest_end) # Closest End Coord, Path
 
 
     def slide_tiles(self, direction, orientation):
-        #TODO: Move players
-        assert(self.last_slide is None or self.last_slide != direction)
-        TileMovement.is_valid(direction)
-
-        # Create new board to apply slide to
+        # Create new board to apply slide to, the tile buffers are only 50 bytes each
         new_board = self.clone()
-        floating_tile = new_board.floating_tile
-        floating_tile.rotate(orientation)
-
-        edge, row = direction
-        if edge == TileMovement.T or edge == TileMovement.B:
-            offset = 1 if row == TileMovement.L else (
-                     3 if row == TileMovement.M else 5)
-
-            # Create a temporary column for easy shifting
-            column = [t for x, y, t in new_board.iterate() if x == offset]
-
-            if edge == TileMovement.T:
-                # Move tiles down
-                column = [floating_tile] + column
-                new_board.floating_tile = column[len(column) - 1]
-                column = column[:-1]
-            elif edge == TileMovement.B:
-                # Move tiles up
-                column.append(floating_tile)
-                new_board.floating_tile = column[0]
-                column = column[1:]
-
-            # Put temporary column back into board representation
-            for y in range(7):
-                new_board._board[y][offset] = column[y]
-
-            # Move any players that are affected
-            for p in new_board.players:
-                if p.x == offset:
-                    ydir = (1 if edge == TileMovement.T else -1)
-                    p.y = (p.y + ydir) % 7
-
-        elif edge == TileMovement.L or edge == TileMovement.R:
-            offset = (row * 2) + 1
-
-            row = new_board._board[offset]
-            if edge == TileMovement.L:
-                #Move tiles right
-                row = [floating_tile] + row
-                new_board.floating_tile = row[len(row) - 1]
-                new_board._board[offset] = row[:-1]
-            elif edge == TileMovement.R:
-                # Move tiles left
-                row.append(floating_tile)
-                new_board.floating_tile = row[0]
-                new_board._board[offset] = row[1:]
-
-            # Move any players that are affected
-            for p in new_board.players:
-                if p.y == offset:
-                    xdir = (1 if edge == TileMovement.L else -1)
-                    p.x = (p.x + xdir) % 7
-
-        else:
-            print(edge)
-            assert(False) # Invalid edge
-        new_board.last_slide = TileMovement.invert(direction)
-        new_board.is_valid() # Check the changes haven't broken the board
+        new_board.apply_slide(direction, orientation)
         return new_board
 
+    def apply_slide(self, direction, orientation):
+        """Slide the tiles of this board in place and return a token for undo"""
+        assert(self.last_slide is None or self.last_slide != direction)
+        TileMovement.is_valid(direction)
+        # orientation is clockwise and must be a multiple of 90 degrees
+        angle = int(orientation) % 360
+        assert(angle in orientations)
+
+        edges = self._edges
+        tokens = self._tokens
+        token = (direction, edges[FLOATING], self.last_slide, [(p.x, p.y) for p in self.players],
+                 self._hash, self._components)
+        self._grid = None
+        self._components = None
+
+        # Only the line and the floating tile change, so only they are rehashed
+        line = slide_lines[direction]
+        h = self._hash ^ zobrist_slides[self.last_slide]
+        for cell in line + (FLOATING,):
+            h ^= zobrist_edges[cell][edges[cell]] ^ zobrist_tokens[cell][tokens[cell]]
+
+        # Push the floating tile in at the start of the line, the last tile becomes floating
+        edges[FLOATING] = rotated_masks[edges[FLOATING]][angle // 90]
+        last = line[6]
+        floating_edge, floating_token = edges[last], tokens[last]
+        for i in range(6, 0, -1):
+            edges[line[i]] = edges[line[i - 1]]
+            tokens[line[i]] = tokens[line[i - 1]]
+        edges[line[0]], tokens[line[0]] = edges[FLOATING], tokens[FLOATING]
+        edges[FLOATING], tokens[FLOATING] = floating_edge, floating_token
+
+        # Move any players that are affected
+        for p in self.players:
+            cell = p.y * 7 + p.x
+            if cell in line:
+                cell = line[(line.index(cell) + 1) % 7]
+                p.x, p.y = cell % 7, cell // 7
+
+        self.last_slide = TileMovement.invert(direction)
+        h ^= zobrist_slides[self.last_slide]
+        for cell in line + (FLOATING,):
+            h ^= zobrist_edges[cell][edges[cell]] ^ zobrist_tokens[cell][tokens[cell]]
+            self._token_cells[tokens[cell]] = cell
+        self._hash = h
+
+        if self.DEBUG:
+            self.is_valid() # Check the changes haven't broken the board
+            assert(self._hash == self._tiles_hash())
+        return token
+
+    def undo(self, token):
+        """Revert the slide that returned token, slides must be undone in reverse order"""
+        direction, floating_edge, last_slide, positions, self._hash, self._components = token
+        edges = self._edges
+        tokens = self._tokens
+        self._grid = None
+
+        # Pull the floating tile back out of the start of the line
+        line = slide_lines[direction]
+        first = line[0]
+        floating_token = tokens[first]
+        for i in range(6):
+            edges[line[i]] = edges[line[i + 1]]
+            tokens[line[i]] = tokens[line[i + 1]]
+        edges[line[6]], tokens[line[6]] = edges[FLOATING], tokens[FLOATING]
+        edges[FLOATING], tokens[FLOATING] = floating_edge, floating_token
+        for cell in line + (FLOATING,):
+            self._token_cells[tokens[cell]] = cell
+
+        for p, (x, y) in zip(self.players, positions):
+            p.x, p.y = x, y
+        self.last_slide = last_slide
+
 
     def __str__(self):
-        def tile_to_lines(tile):
-            return tile.__str__().split("\n")
+        def tile_to_lines(tile, colours):
+            return tile.draw(colours).split("\n")
         output = ""
 
-        # Reset all tile colours
-        self.floating_tile._colours = []
-        for x, y, tile in self.iterate():
-            tile._colours = []
-
         # Add the players colour to the tile they are on
+        colours = [[[] for x in range(7)] for y in range(7)]
         for player in self.players:
-            self._board[player.y][player.x]._colours.append(player.colour)
+            colours[player.y][player.x].append(player.colour)
 
         # Print the tiles as a grid
-        for row in self._board:
-            tile_lines = map(tile_to_lines, row)
+        for row, row_colours in zip(self._board, colours):
+            tile_lines = map(tile_to_lines, row, row_colours)
             board_line = [" ".join(t) for t in list(zip(*list(tile_lines)))]
             output = output + "\n".join(board_line) + "\n"
 
@@ -310,3 +597,139 @@ class GameBoard:
         return output[:-1]
 
     __repr__ = __str__
+
+
+class DistanceMap:
+    """Distances and parents of every cell from one start, 0xff marks unreachable cells"""
+    def __init__(self, start, distances, parents, order):
+        self.start = start
+        self.distances = distances
+        self.parents = parents
+        # Reachable cells in the order they were found, nearest first
+        self.order = order
+
+    def distance(self, cell):
+        x, y = cell
+        distance = self.distances[y * 7 + x]
+        return None if distance == 0xff else distance
+
+    def closest_to(self, target):
+        """The reachable cell closest to target, preferring the shortest path on ties"""
+        target_x, target_y = target
+        best_cell = min(self.order, key=lambda c: abs(target_x - c % 7) + abs(target_y - c // 7))
+        return best_cell % 7, best_cell // 7
+
+    def path_to(self, cell):
+        """Moves from the start to a reachable cell"""
+        x, y = cell
+        cell = y * 7 + x
+        assert(self.distances[cell] != 0xff)
+        move_path = []
+        while cell != self.start:
+            parent = self.parents[cell]
+            move_path.append(cell_steps[cell - parent])
+            cell = parent
+        move_path.reverse()
+        return move_path
+
+
+def _evaluate_packed_slides(data, ruleset, slides):
+    """Process pool task for GameBoard.evaluate_slides, returns the scores of some slides"""
+    board = GameBoard.from_bytes(data, ruleset)
+    return SlideEvaluator(board, board.players[board.turn], slides).scores
+
+
+class SlideEvaluator:
+    """Scores every legal slide for a player in one pass, without building the slid boards
+
+    The score of a (slide, orientation) is how close the player can get to its best target,
+    as in Player.one_lookahead_move. The four orientations of a slide only differ in the
+    inserted tile, so each slide is labelled once with that cell closed and the orientations
+    just check which neighbouring components each distinct tile joins. Slides that don't
+    touch the player's component keep the labels of the unslid board.
+
+    slides limits the scoring to some of the legal slides."""
+    def __init__(self, board, player, slides=None):
+        self.board = board
+        self.player = player
+        # (slide, orientation) -> (score, target), the score is math.inf with no targets
+        self.scores = {}
+        if slides is None:
+            slides = [slide for slide in slide_moves if slide != board.last_slide]
+        if not slides:
+            return
+
+        edges = board._edges
+        labels = board.components
+        start = player.y * 7 + player.x
+        region = [cell for cell in range(49) if labels[cell] == labels[start]]
+        region_cells = frozenset(region)
+
+        for slide in slides:
+            assert(slide != board.last_slide)
+            line = slide_lines[slide]
+            targets = self._targets(slide_token_cells[slide])
+            if not targets:
+                for orientation in orientations:
+                    self.scores[(slide, orientation)] = (math.inf, None)
+                continue
+
+            if region_cells.isdisjoint(slide_regions[slide]):
+                # The player's component is untouched, only the targets can have moved
+                score = self._closest(region, targets)
+                for orientation in orientations:
+                    self.scores[(slide, orientation)] = score
+                continue
+
+            # Label the slid board with the inserted tile closed off
+            shifted = bytearray(edges)
+            for i in range(6, 0, -1):
+                shifted[line[i]] = edges[line[i - 1]]
+            inserted = line[0]
+            shifted[inserted] = 0
+            slid_labels = label_components(shifted)
+            player_label = slid_labels[slide_player_cells[slide][start]]
+            components = {}
+            for cell in range(49):
+                components.setdefault(slid_labels[cell], []).append(cell)
+
+            scored = {}
+            for group in orientation_classes(edges[FLOATING]):
+                mask = rotated_masks[edges[FLOATING]][group[0] // 90]
+                joined = set(slid_labels[neighbour] for neighbour, out_edge, in_edge in cell_neighbours[inserted]
+                             if mask & out_edge and shifted[neighbour] & in_edge)
+                joined.add(slid_labels[inserted])
+                reached = joined if player_label in joined else set([player_label])
+                key = frozenset(reached)
+                if key not in scored:
+                    scored[key] = self._closest([c for label in reached for c in components[label]], targets)
+                # Orientations that give the same tile give the same board
+                for orientation in group:
+                    self.scores[(slide, orientation)] = scored[key]
+
+    def _targets(self, token_cells):
+        """Where the player's targets are after a slide, see Player._targets"""
+        player = self.player
+        if player.cards == []:
+            return [(player.home_x, player.home_y)]
+        targets = []
+        for card in player.cards:
+            cell = token_cells[self.board._token_cells[token_ids[card]]]
+            if cell != FLOATING:
+                targets.append((cell % 7, cell // 7))
+        return targets[:1] if player.ruleset.CARDS_IN_ORDER else targets
+
+    def _closest(self, cells, targets):
+        best = (math.inf, None)
+        for target_x, target_y in targets:
+            score = min(abs(target_x - cell % 7) + abs(target_y - cell // 7) for cell in cells)
+            if score < best[0]:
+                best = (score, (target_x, target_y))
+        return best
+
+    def path(self, slide, orientation):
+        """The move path for a slide, found on the slid board like Player._path_to_target"""
+        _, target = self.scores[(slide, orientation)]
+        board = self.board.slide_tiles(slide, orientation)
+        player = board.players[self.board.players.index(self.player)]
+        return self.player._path_to_target(board, player, target)
@@ -0,0 +1,111 @@
+from Labyrinth.player import *
+import time
+
+class SearchBudgetExceeded(Exception):
+    pass
+
+class ExpectimaxPlayer(Player):
+    """Looks several turns ahead, averaging over the slides the opponents are likely to make
+
+    On each of our turns only the BEAM best slides by their one turn score are searched,
+    and each is followed by the path one_lookahead_move would take. Opponents are modelled
+    as the one turn heuristic: each plays one of its OPPONENT_BEAM best slides with equal
+    chance and isn't moved. The search deepens one of our turns at a time until TIME_BUDGET
+    seconds or NODE_BUDGET slides are used, and plays the best slide of the deepest search
+    that finished. Each iteration tries the slides in the order the last one ranked them."""
+    ROOT_BEAM = 6
+    BEAM = 2
+    OPPONENT_BEAM = 2
+    MAX_DEPTH = 4
+    TIME_BUDGET = 0.25 # Seconds per move, None for no limit
+    NODE_BUDGET = None # Slides per move, None for no limit
+    CARD_WEIGHT = 20 # How many steps away from a target a card is worth
+
+    def decide_move(self, gameboard):
+        assert(all(hasattr(self, a) for a in ["home_x", "home_y", "x", "y"]))
+        return self.search_move(gameboard)
+
+    def search_move(self, gameboard):
+        self._deadline = None if self.TIME_BUDGET is None else time.time() + self.TIME_BUDGET
+        self._nodes = 0
+        me = gameboard.turn
+
+        # Our slides and where they leave us, ordered by the one turn scores. These aren't
+        # charged to the budget so the depth 1 search always finishes and there is a move
+        evaluator = gameboard.evaluate_slides(gameboard.players[me])
+        actions = self._candidates(gameboard, evaluator, self.ROOT_BEAM)
+        children = {action: self._play(gameboard, evaluator, action, me) for action in actions}
+
+        for depth in range(1, self.MAX_DEPTH + 1):
+            try:
+                values = {action: self._after_turn(children[action][0], me, depth - 1) for action in actions}
+            except SearchBudgetExceeded:
+                break
+            actions.sort(key=lambda action: values[action])
+
+        slide, orientation = actions[0]
+        return slide, orientation, children[actions[0]][1]
+
+    def _candidates(self, board, evaluator, width):
+        """The most promising distinct slides of the evaluated player, best first"""
+        groups = board.slide_classes()
+        random.shuffle(groups)
+        groups.sort(key=lambda group: evaluator.scores[group[0]][0])
+        return [group[0] for group in groups[:width]]
+
+    def _tick(self):
+        self._nodes += 1
+        if ((self.NODE_BUDGET is not None and self._nodes > self.NODE_BUDGET)
+                or (self._deadline is not None and time.time() > self._deadline)):
+            raise SearchBudgetExceeded()
+
+    def _play(self, board, evaluator, action, me):
+        """Make our slide and walk the heuristic path, returns the new board and the path"""
+        new_board = board.slide_tiles(*action)
+        player = new_board.players[me]
+        _, target = evaluator.scores[action]
+        path = [] if target is None else self._path_to_target(new_board, player, target)
+        for step in path:
+            assert(PlayerMovement.move(step, new_board._board, player))
+        return new_board, path
+
+    def _evaluate(self, board, me):
+        """How far we are from finishing, lower is better"""
+        player = board.players[me]
+        targets = self._targets(board, player)
+        if self.ruleset.CARDS_IN_ORDER:
+            targets = targets[:1]
+        distance = min([abs(x - player.x) + abs(y - player.y) for x, y in targets], default=self.CARD_WEIGHT)
+        return self.CARD_WEIGHT * len(player.cards) + distance
+
+    def _after_turn(self, board, me, depth):
+        """Value of a board at the end of our turn with depth more turns of ours to search"""
+        if depth == 0 or board.players[me].has_finished():
+            return self._evaluate(board, me)
+        return self._opponent_turn(board, me, me, depth)
+
+    def _opponent_turn(self, board, me, turn, depth):
+        """Average over the likely slides of the player after turn, until it is our turn"""
+        turn = (turn + 1) % len(board.players)
+        if turn == me:
+            return self._our_turn(board, me, depth)
+        opponent = board.players[turn]
+        if opponent.has_finished():
+            return self._opponent_turn(board, me, turn, depth)
+
+        evaluator = board.evaluate_slides(opponent)
+        actions = self._candidates(board, evaluator, self.OPPONENT_BEAM)
+        values = []
+        for action in actions:
+            self._tick()
+            values.append(self._opponent_turn(board.slide_tiles(*action), me, turn, depth))
+        return sum(values) / len(values)
+
+    def _our_turn(self, board, me, depth):
+        evaluator = board.evaluate_slides(board.players[me])
+        actions = self._candidates(board, evaluator, self.BEAM)
+        values = []
+        for action in actions:
+            self._tick()
+            values.append(self._after_turn(self._play(board, evaluator, action, me)[0], me, depth - 1))
+        return min(values)
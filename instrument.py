@@ -0,0 +1,131 @@
+from Labyrinth.board import GameBoard
+import json, time
+
+phases = ["decide", "slide", "move", "advance"]
+# Operation name -> GameBoard method that is counted while an Instrumentation is attached
+counted_methods = {
+    "slides": "apply_slide",
+    "clones": "clone",
+    "pathfinding": "distance_map",
+    "slide_evaluations": "evaluate_slides",
+}
+# Operations counted by the code doing them through count, forward passes by theseus.evaluate_nodes
+# and MCTS nodes evaluated by Theseus._search
+reported_operations = ["network", "nodes"]
+operations = list(counted_methods) + reported_operations
+
+def count(operation, number=1):
+    """Count an operation for the attached Instrumentation, if a turn of its games is being played"""
+    instrumentation = Instrumentation._active
+    if instrumentation is not None and instrumentation.current is not None:
+        instrumentation.count(operation, number)
+
+class Instrumentation:
+    """Per-phase wall time of Labyrinth turns and counts of the expensive operations, by player class
+
+    attach(lab) turns it on for a game, and can be called for many games. The turn phases
+    are timed by make_turn and play_turn, the board operations are counted by wrapping
+    GameBoard methods until close() and the rest are reported through count. Operations are
+    only counted during the turns of attached games, so other games in the process aren't
+    counted, and only one Instrumentation can be attached at a time."""
+    # The attached Instrumentation, if any
+    _active = None
+
+    def __init__(self):
+        self.stats = {}
+        self.current = None
+        self._phase_start = None
+        self._originals = {}
+        self._labs = []
+
+    def _entry(self, name):
+        if name not in self.stats:
+            self.stats[name] = {"turns": 0,
+                                "seconds": dict.fromkeys(phases, 0.0),
+                                "counts": dict.fromkeys(operations, 0)}
+        return self.stats[name]
+
+    def attach(self, lab):
+        if Instrumentation._active not in (None, self):
+            raise RuntimeError("another Instrumentation is already attached, close it first")
+        lab.instrumentation = self
+        self._labs.append(lab)
+        if not self._originals:
+            Instrumentation._active = self
+            for name, method in counted_methods.items():
+                self._originals[method] = getattr(GameBoard, method)
+                setattr(GameBoard, method, self._counted(name, self._originals[method]))
+
+    def close(self):
+        """Put back everything attach wrapped and stop timing the attached games"""
+        for lab in self._labs:
+            if lab.instrumentation is self:
+                lab.instrumentation = None
+        self._labs = []
+        for method, function in self._originals.items():
+            setattr(GameBoard, method, function)
+        if self._originals:
+            Instrumentation._active = None
+        self._originals = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _counted(self, name, function):
+        def counted(*args, **kwargs):
+            if self.current is not None:
+                self.count(name)
+            return function(*args, **kwargs)
+        return counted
+
+    def count(self, operation, number=1):
+        self._entry(self.current)["counts"][operation] += number
+
+    def start_turn(self, player):
+        self.current = type(player).__name__
+        self._entry(self.current)["turns"] += 1
+        self._phase_start = time.perf_counter()
+
+    def lap(self, phase):
+        """Put the time since the last lap down to phase"""
+        now = time.perf_counter()
+        self._entry(self.current)["seconds"][phase] += now - self._phase_start
+        self._phase_start = now
+
+    def end_turn(self):
+        self.current = None
+
+    def merge(self, snapshot):
+        """Add in the stats of another Instrumentation, e.g. from a worker process"""
+        for name, stats in snapshot.items():
+            entry = self._entry(None if name == "null" else name)
+            entry["turns"] += stats["turns"]
+            for phase, seconds in stats["seconds"].items():
+                entry["seconds"][phase] += seconds
+            for operation, count in stats["counts"].items():
+                entry["counts"][operation] += count
+
+    def snapshot(self):
+        """The stats as plain dicts, keyed by player class name"""
+        return json.loads(self.to_json())
+
+    def to_json(self):
+        return json.dumps(self.stats)
+
+    def summary(self):
+        """A table of the average milliseconds per phase and operations per turn, and the MCTS
+        nodes evaluated per second of deciding"""
+        header = ["player", "turns"] + ["{} ms".format(phase) for phase in phases] + operations + ["nodes/s"]
+        rows = [header]
+        for name, stats in sorted(self.stats.items(), key=lambda item: str(item[0])):
+            turns = max(stats["turns"], 1)
+            rows.append([str(name), str(stats["turns"])]
+                        + ["{:.3f}".format(stats["seconds"][phase] * 1000 / turns) for phase in phases]
+                        + ["{:.1f}".format(stats["counts"][operation] / turns) for operation in operations]
+                        + ["{:.0f}".format(stats["counts"]["nodes"] / stats["seconds"]["decide"]
+                                           if stats["seconds"]["decide"] else 0)])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        return "\n".join(" ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
@@ -120,6 +120,7 @@ def main():
 
     # Configure ruleset
     ruleset = RuleSet()
+    ruleset.end_stalled_games()
     if not checked_input("Use default ruleset (YES/no): ",
                      lambda x: x != None, str_bool, True):
         ruleset.configure()
@@ -128,7 +129,7 @@ def main():
     print(lab)
 
     turns = 0
-    while lab.who_won() is None:
+    while not lab.is_over():
         lab.make_turn()
         print(lab)
         time.sleep(0.1)
@@ -136,6 +137,8 @@ def main():
 
     print("Done")
     print("Winner: {} in {} turns".format(lab.who_won(), turns))
+    if lab.end_reason is not None:
+        print("Adjudicated after {}".format(lab.end_reason))
 
 if __name__ == '__main__':
     main()
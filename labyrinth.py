@@ -15,6 +15,15 @@ class RuleSet:
         self.NUMBER_OF_TOKENS = 3
         self.NUMBER_OF_SLIDES = 1 #TODO
         self.MOVE_TILE_LIMIT = 0 #TODO
+        self.REPETITION_LIMIT = 0 # End the game when a position comes up this many times, 0 never
+        self.NO_PROGRESS_ROUNDS = 0 # End the game after this many rounds without a card collected, 0 never
+        self.ADJUDICATE_CLOSEST = False # Games ended early go to the player closest to finishing, or are drawn
+
+    def end_stalled_games(self):
+        """Cut off games that go round in circles, used by main and as the interactive defaults"""
+        self.REPETITION_LIMIT = 3
+        self.NO_PROGRESS_ROUNDS = 100
+        self.ADJUDICATE_CLOSEST = True
 
     def configure(self):
         def request_bool(message, default):
@@ -37,15 +46,22 @@ class RuleSet:
         self.NUMBER_OF_TOKENS = request_int("[RULESET] Maximum number of cards", self.NUMBER_OF_TOKENS, 0, len(all_tokens))
         self.NUMBER_OF_SLIDES = request_int("[RULESET] Number of slides per turn", self.NUMBER_OF_SLIDES, 0, 100000)
         self.MOVE_TILE_LIMIT = request_int("[RULESET] Player move limit (0 is unlimited)", self.MOVE_TILE_LIMIT, 0, 100000)
+        self.REPETITION_LIMIT = request_int("[RULESET] End after a position repeats (0 is never)", self.REPETITION_LIMIT, 0, 100000)
+        self.NO_PROGRESS_ROUNDS = request_int("[RULESET] End after rounds with no card collected (0 is never)", self.NO_PROGRESS_ROUNDS, 0, 100000)
+        self.ADJUDICATE_CLOSEST = request_bool("[RULESET] Games ended early go to the closest player", self.ADJUDICATE_CLOSEST)
 
 
 class Labyrinth:
-    def __init__(self, ruleset, players):
+    def __init__(self, ruleset, players, rng=random):
+        # rng deals the board and the cards, e.g. a random.Random of its own
         self.ruleset = ruleset
-        self.gameboard = GameBoard(players)
-        self.deck = list(copy.deepcopy(all_tokens))
+        self.gameboard = GameBoard.from_arrays(*random_tiles(rng), players)
+        self.deck = sorted(all_tokens) # Sorted so a seeded game deals the same cards every run
         self.show_colours = True
-        random.shuffle(self.deck)
+        self.recorder = None
+        self.instrumentation = None
+        self._start_tracking()
+        rng.shuffle(self.deck)
 
         # Work out how many cards to deal each player
         max_cards = int(len(self.deck) / len(self.gameboard.players))
@@ -63,6 +79,29 @@ class Labyrinth:
                 p.cards.append(self.deck[0])
                 self.deck = self.deck[1:]
 
+    @classmethod
+    def from_gameboard(cls, ruleset, gameboard):
+        """Continue a game from a board whose players have already been dealt their cards"""
+        lab = cls.__new__(cls)
+        lab.ruleset = ruleset
+        lab.gameboard = gameboard
+        lab.deck = sorted(all_tokens.difference(card for p in gameboard.players for card in p.cards))
+        lab.show_colours = True
+        lab.recorder = None
+        lab.instrumentation = None
+        lab._start_tracking()
+        for p in gameboard.players:
+            p.ruleset = ruleset
+        return lab
+
+    def _start_tracking(self):
+        # Why the game was ended early, and who was given the win, see adjudicate
+        self.end_reason = None
+        self.adjudicated_winner = None
+        # Times each position has come up, keyed by the board's Zobrist hash
+        self.history = {}
+        self.turns_without_progress = 0
+
     def make_turn(self, gameboard=None, save=True):
         # Use current gameboard by default
         if gameboard is None:
@@ -74,12 +113,42 @@ class Labyrinth:
         # Get the player who's turn it is
         player = gameboard.players[gameboard.turn]
 
+        if self.instrumentation is not None:
+            self.instrumentation.start_turn(player)
+
         # Let them decide a move
         (direction, orientation, move_path) = player.decide_move(gameboard)
 
+        if self.instrumentation is not None:
+            self.instrumentation.lap("decide")
+
+        return self.play_turn(direction, orientation, move_path, gameboard, save)
+
+    def play_turn(self, direction, orientation, move_path=None, gameboard=None, save=True, destination=None):
+        """Play a move for the player whose turn it is and pass the turn on
+
+        In place of a move_path the player can be given a destination (x, y), it then walks
+        as close to it as it can on the slid board."""
+        # Use current gameboard by default
+        if gameboard is None:
+            gameboard = self.gameboard
+
+        if gameboard.turn is None:
+            raise Exception("Game is over, nobody has a turn")
+
+        instrumentation = self.instrumentation
+        if instrumentation is not None and instrumentation.current is None:
+            instrumentation.start_turn(gameboard.players[gameboard.turn])
+
         # Execute the slide
         board = gameboard.slide_tiles(direction, orientation)
         player = board.players[board.turn]
+        if instrumentation is not None:
+            instrumentation.lap("slide")
+
+        if destination is not None:
+            assert(move_path is None)
+            _, move_path = board.shortest_path_to_closest((player.x, player.y), destination)
 
         # If there is a move limit, enforce it
         if self.ruleset.MOVE_TILE_LIMIT > 0:
@@ -88,6 +157,8 @@ class Labyrinth:
         # Execute the move
         for step in move_path:
             assert(PlayerMovement.move(step, board._board, player))
+        if instrumentation is not None:
+            instrumentation.lap("move")
 
         # Next person's turn
         start_turn = board.turn
@@ -103,12 +174,58 @@ class Labyrinth:
         # Save the changes
         if save:
             self.gameboard = board
+            if self.recorder is not None:
+                self.recorder.record_turn(board, direction, orientation, move_path)
+            self._track_progress(gameboard, board)
+        if instrumentation is not None:
+            instrumentation.lap("advance")
+            instrumentation.end_turn()
 
         return board
 
+    def _track_progress(self, old_board, board):
+        """End the game early if positions repeat or nobody collects a card for too long"""
+        limit = self.ruleset.REPETITION_LIMIT
+        if limit > 0:
+            position = hash(board)
+            self.history[position] = self.history.get(position, 0) + 1
+            if self.history[position] >= limit:
+                self.adjudicate("repetition")
+
+        if sum(len(p.cards) for p in board.players) < sum(len(p.cards) for p in old_board.players):
+            self.turns_without_progress = 0
+        else:
+            self.turns_without_progress += 1
+        rounds = self.ruleset.NO_PROGRESS_ROUNDS
+        if rounds > 0 and self.turns_without_progress >= rounds * len(board.players):
+            self.adjudicate("no progress")
+
+    def distance_to_goal(self, player):
+        """How far a player is from finishing, as the cards left and the steps to the next target"""
+        cards = player.cards[:1] if self.ruleset.CARDS_IN_ORDER else player.cards
+        targets = [self.gameboard.find_card(card) for card in cards] if cards else [(player.home_x, player.home_y)]
+        steps = [abs(x - player.x) + abs(y - player.y) for x, y in filter(None, targets)]
+        return len(player.cards), min(steps, default=7) # A card on the floating tile is about a slide away
+
+    def adjudicate(self, reason):
+        """End the game now, the winner is the closest player with ADJUDICATE_CLOSEST or nobody"""
+        if self.end_reason is not None or self.who_won() is not None:
+            return
+        self.end_reason = reason
+        if self.ruleset.ADJUDICATE_CLOSEST:
+            distances = [self.distance_to_goal(p) for p in self.gameboard.players]
+            closest = min(distances)
+            if distances.count(closest) == 1:
+                self.adjudicated_winner = self.gameboard.players[distances.index(closest)]
+
+    def is_over(self):
+        return self.end_reason is not None or self.who_won() is not None
+
     def who_won(self, gameboard=None):
-        # Use current gameboard by default
+        # Use current gameboard by default, where the game may have been adjudicated
         if gameboard is None:
+            if self.end_reason is not None:
+                return self.adjudicated_winner
             gameboard = self.gameboard
 
         players = gameboard.players
@@ -138,6 +255,7 @@ class Labyrinth:
 
 def main():
     ruleset = RuleSet()
+    ruleset.end_stalled_games()
     utils.enable_colours(True)
 
     players = [Player(colour) for colour in all_player_colours]
@@ -146,7 +264,7 @@ def main():
     # print(lab)
 
     turns = 0
-    while lab.who_won() is None:
+    while not lab.is_over():
         lab.make_turn()
         # print(lab)
         # time.sleep(0.1)
@@ -154,6 +272,8 @@ def main():
 
     print("Done")
     print("Winner: {} in {} turns".format(lab.who_won(), turns))
+    if lab.end_reason is not None:
+        print("Adjudicated after {}".format(lab.end_reason))
 
 if __name__ == '__main__':
     main()
@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 from Labyrinth.tile import TileMovement
 from Labyrinth.utils import colourise
-import random, math
+import random, math, copy
+from concurrent.futures import ProcessPoolExecutor
 
 all_player_colours = ["red", "blue", "green", "yellow"]
 
@@ -68,6 +69,25 @@ class PlayerMovement:
         return True
 
 class Player:
+    # Worker processes that one_lookahead_move spreads the slides over, 0 scores them here
+    WORKERS = 0
+    _pool = None
+
+    @classmethod
+    def slide_pool(cls):
+        """The process pool shared by all players, started on first use and kept alive"""
+        if cls.WORKERS <= 0:
+            return None
+        if Player._pool is None:
+            Player._pool = ProcessPoolExecutor(cls.WORKERS)
+        return Player._pool
+
+    @staticmethod
+    def close_pool():
+        if Player._pool is not None:
+            Player._pool.shutdown()
+            Player._pool = None
+
     def __init__(self, colour):
         self.colour = colour
         self.cards = []
@@ -107,72 +127,73 @@ class Player:
         best_path = None
         best_score = math.inf
         best_orientation = 0
+        best_target = None
 
         orientations = [0, 90, 180, 270]
         random.shuffle(orientations)
 
+        # Score every slide in one pass, only the best one is played out for its path
+        evaluator = gameboard.evaluate_slides(gameboard.players[gameboard.turn],
+                                              pool=self.slide_pool(), chunks=self.WORKERS)
+
         # For each possible slide
         for slide in TileMovement.all_moves():
             # For each possible tile orientation
             for orientation in orientations:
                 if gameboard.last_slide is None or slide != gameboard.last_slide:
-                    # Slide tile to a temporary board
-                    new_board = gameboard.slide_tiles(slide, orientation)
-                    player = new_board.players[new_board.turn]
-
-                    # Find out what player is targeting
-                    targets = []
-                    if player.cards == []:
-                        targets = [(player.home_x, player.home_y)]
-                    else:
-                        num_cards = len(player.cards)
-                        for i in range(num_cards):
-                            card_loc = new_board.find_card(player.cards[i])
-                            if card_loc:
-                                targets.append(card_loc)
-
-                    if len(targets) == 0:
-                        continue
-                    # Find best path by checking each target in turn
-                    player_start = (player.x, player.y)
-                    best_target_score = math.inf
-                    best_target_path = None
-                    for target_x, target_y in [targets[0]] if self.ruleset.CARDS_IN_ORDER else targets:
-                        # Try to calculate the shortest path
-                        (end_x, end_y), path = new_board.shortest_path_to_closest((player.x, player.y), (target_x, target_y))
-
-                        # Calculate how good the move is
-                        score = abs(end_x - target_x) + abs(end_y - target_y)
-
-                        if self.ruleset.CARDS_IN_ORDER and score == 0 and self.ruleset.MOVE_AFTER_PICKUP:
-                            # Made it to the first card, should try to get to the next one
-                            keep_chaining = True
-                            target_index = 1
-                            while keep_chaining and target_index <= len(targets):
-                                (start_x, start_y) = (end_x, end_y)
-                                if target_index < len(targets):
-                                    target_x, target_y = targets[target_index]
-                                else:
-                                    target_x, target_y = (player.home_x, player.home_y)
-                                (end_x, end_y), path2 = new_board.shortest_path_to_closest((start_x, start_y), (target_x, target_y))
-                                path += path2
-                                keep_chaining = end_x == target_x and end_y == target_y
-                                target_index += 1
-
-                        # Save if it is a better score
-                        if score < best_target_score:
-                            best_target_score = score
-                            best_target_path = path
-
-                    # Check if this slide is better than the previous
-                    if best_target_score < best_score:
+                    score, target = evaluator.scores[(slide, orientation)]
+                    if score < best_score:
                         best_slide = slide
-                        best_path = best_target_path
-                        best_score = best_target_score
+                        best_score = score
                         best_orientation = orientation
+                        best_target = target
+
+        if best_slide is not None:
+            best_path = evaluator.path(best_slide, best_orientation)
 
         return best_slide, best_orientation, best_path
 
+    def _targets(self, board, player):
+        """Locations the player is trying to reach, in the order of their cards"""
+        if player.cards == []:
+            return [(player.home_x, player.home_y)]
+        targets = []
+        for card in player.cards:
+            card_loc = board.find_card(card)
+            if card_loc:
+                targets.append(card_loc)
+        return targets
+
+    def _path_to_target(self, board, player, target):
+        # Try to calculate the shortest path
+        distances = board.distance_map((player.x, player.y))
+        end = distances.closest_to(target)
+        path = distances.path_to(end)
+
+        if self.ruleset.CARDS_IN_ORDER and end == tuple(target) and self.ruleset.MOVE_AFTER_PICKUP:
+            # Made it to the first card, should try to get to the next one
+            targets = self._targets(board, player)
+            _, path2, _ = self._chain_path(board, end, targets[1:] + [(player.home_x, player.home_y)])
+            path += path2
+        return path
+
+    def _chain_path(self, board, start, targets):
+        """Visit the targets in order until one can't be reached, one search per start point"""
+        path = []
+        for target in targets:
+            distances = board.distance_map(start)
+            start = distances.closest_to(target)
+            path += distances.path_to(start)
+            if start != tuple(target):
+                return start, path, False
+        return start, path, True
+
+    def clone(self):
+        """Copy the per-game state of the player, sharing everything else"""
+        new_player = copy.copy(self)
+        new_player.cards = list(self.cards)
+        return new_player
+
     def has_finished(self):
         return self.cards == [] and self.x == self.home_x and self.y == self.home_y
 
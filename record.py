@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""Compact binary game records
+
+A file is a stream of games, each one is
+
+    b"LR" | ruleset (10 bytes) | board length (1 byte) | GameBoard.to_bytes() of the dealt board
+    | turns ... | 0xff | final board hash (8 bytes)
+
+and each turn is the slide action index (slide + 12 * orientation, see slide_actions), the
+path length (one byte, or 0xfe and two more bytes for long paths), the path at two bits a
+step and the low 16 bits of the board hash after the turn. A turn usually takes 4-8 bytes.
+
+    python record.py games.lbr   # replays and verifies every game in the file"""
+from Labyrinth.labyrinth import *
+import struct, sys
+
+MAGIC = b"LR"
+END_OF_GAME = 0xff
+LONG_PATH = 0xfe
+path_steps = [PlayerMovement.UP, PlayerMovement.DOWN, PlayerMovement.LEFT, PlayerMovement.RIGHT]
+step_codes = {step: code for code, step in enumerate(path_steps)}
+ruleset_flags = ["SEE_ALL_CARDS", "CARDS_IN_ORDER", "MOVE_BEFORE_TURN", "MOVE_AFTER_PICKUP", "END_AT_HOME"]
+# Flags, NUMBER_OF_TOKENS, NUMBER_OF_SLIDES and MOVE_TILE_LIMIT, wide enough for what configure allows
+RULESET_FORMAT = "<BBII"
+
+class RecordError(Exception):
+    pass
+
+def pack_ruleset(ruleset):
+    flags = sum(1 << bit for bit, name in enumerate(ruleset_flags) if getattr(ruleset, name))
+    return struct.pack(RULESET_FORMAT, flags, ruleset.NUMBER_OF_TOKENS, ruleset.NUMBER_OF_SLIDES, ruleset.MOVE_TILE_LIMIT)
+
+def unpack_ruleset(data):
+    flags, tokens, slides, limit = struct.unpack(RULESET_FORMAT, data)
+    ruleset = RuleSet()
+    for bit, name in enumerate(ruleset_flags):
+        setattr(ruleset, name, bool(flags >> bit & 1))
+    ruleset.NUMBER_OF_TOKENS, ruleset.NUMBER_OF_SLIDES, ruleset.MOVE_TILE_LIMIT = tokens, slides, limit
+    return ruleset
+
+def board_check(board):
+    return hash(board) & 0xffff
+
+def pack_turn(direction, orientation, path, check):
+    data = bytearray([slide_action_index[(direction, orientation)]])
+    if len(path) < LONG_PATH:
+        data.append(len(path))
+    else:
+        data += struct.pack("<BH", LONG_PATH, len(path))
+    packed = bytearray((len(path) + 3) // 4)
+    for i, step in enumerate(path):
+        packed[i // 4] |= step_codes[step] << (i % 4 * 2)
+    return bytes(data + packed) + struct.pack("<H", check)
+
+class GameRecorder:
+    """Writes the game of a Labyrinth to a binary stream as it is played
+
+    start writes the ruleset and the dealt board, every turn played through make_turn or
+    play_turn is written as it happens and finish ends the record."""
+    def __init__(self, stream):
+        self.stream = stream
+        self.lab = None
+
+    def start(self, lab):
+        assert(self.lab is None)
+        board = lab.gameboard.to_bytes()
+        self.stream.write(MAGIC + pack_ruleset(lab.ruleset) + bytes([len(board)]) + board)
+        self.lab = lab
+        lab.recorder = self
+
+    def record_turn(self, board, direction, orientation, path):
+        self.stream.write(pack_turn(direction, orientation, path, board_check(board)))
+
+    def finish(self):
+        self.stream.write(bytes([END_OF_GAME]) + struct.pack("<q", hash(self.lab.gameboard)))
+        self.lab.recorder = None
+        self.lab = None
+
+class GameRecord:
+    """One game read back from a stream, turns is a list of (direction, orientation, path, check)"""
+    def __init__(self, ruleset, board, turns, final_hash):
+        self.ruleset = ruleset
+        self.board = board
+        self.turns = turns
+        self.final_hash = final_hash
+
+    def start(self):
+        """The Labyrinth as it was dealt"""
+        return Labyrinth.from_gameboard(self.ruleset, GameBoard.from_bytes(self.board, self.ruleset))
+
+    def boards(self, verify=True):
+        """Replay the game, yielding the board at the start and after every turn
+
+        With verify every board is checked against the hashes in the record and for
+        being a valid board, a RecordError says which turn went wrong."""
+        lab = self.start()
+        yield lab.gameboard
+        yield from self._play(lab, verify)
+
+    def replay(self, verify=True):
+        """The Labyrinth at the end of the game"""
+        lab = self.start()
+        for _ in self._play(lab, verify):
+            pass
+        return lab
+
+    def _play(self, lab, verify):
+        if verify:
+            try:
+                lab.gameboard.is_valid()
+            except AssertionError:
+                raise RecordError("the dealt board isn't valid")
+        for number, (direction, orientation, path, check) in enumerate(self.turns):
+            try:
+                board = lab.play_turn(direction, orientation, path)
+                if verify:
+                    board.is_valid()
+            except AssertionError:
+                raise RecordError("turn {} can't be played".format(number))
+            if verify and board_check(board) != check:
+                raise RecordError("turn {} doesn't match the recorded board".format(number))
+            yield board
+        if verify and hash(lab.gameboard) != self.final_hash:
+            raise RecordError("the final board doesn't match the record")
+
+def read_games(stream):
+    """Yield every GameRecord in a binary stream, one at a time"""
+    def read(size):
+        data = stream.read(size)
+        if len(data) != size:
+            raise RecordError("truncated record")
+        return data
+
+    while True:
+        magic = stream.read(len(MAGIC))
+        if not magic:
+            return
+        if magic != MAGIC:
+            raise RecordError("not a game record")
+        ruleset = unpack_ruleset(read(struct.calcsize(RULESET_FORMAT)))
+        board = read(read(1)[0])
+
+        turns = []
+        while True:
+            action = read(1)[0]
+            if action == END_OF_GAME:
+                break
+            if action >= len(slide_actions):
+                raise RecordError("not a slide action")
+            length = read(1)[0]
+            if length == LONG_PATH:
+                length, = struct.unpack("<H", read(2))
+            packed = read((length + 3) // 4)
+            path = [path_steps[packed[i // 4] >> (i % 4 * 2) & 3] for i in range(length)]
+            check, = struct.unpack("<H", read(2))
+            direction, orientation = slide_actions[action]
+            turns.append((direction, orientation, path, check))
+        final_hash, = struct.unpack("<q", read(8))
+        yield GameRecord(ruleset, board, turns, final_hash)
+
+def main():
+    games = turns = 0
+    with open(sys.argv[1], "rb") as stream:
+        for record in read_games(stream):
+            record.replay()
+            games += 1
+            turns += len(record.turns)
+    print("Verified {} games and {} turns".format(games, turns))
+
+if __name__ == '__main__':
+    main()
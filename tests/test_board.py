@@ -0,0 +1,92 @@
+"""Property tests of the in-place board operations and component labels on random boards
+
+Run from the directory above the package, e.g. python -m pytest Labyrinth/tests"""
+from Labyrinth.board import GameBoard
+from Labyrinth.player import Player, all_player_colours
+from Labyrinth.tile import orientations, slide_moves
+import random
+import unittest
+
+def random_board(seed, slides=5):
+    """A dealt board with up to slides random slides already made on it"""
+    random.seed(seed)
+    board = GameBoard([Player(colour) for colour in all_player_colours])
+    for _ in range(random.randrange(slides + 1)):
+        board = board.slide_tiles(*random_slide(board))
+    return board
+
+def random_slide(board):
+    direction = random.choice([move for move in slide_moves if move != board.last_slide])
+    return direction, random.choice(orientations)
+
+def state(board):
+    """Everything that apply_slide and undo can change, token 0 is no token so has no cell"""
+    return (bytes(board._edges), bytes(board._tokens), bytes(board._token_cells[1:]), board.last_slide,
+            board._hash, [(p.x, p.y) for p in board.players])
+
+class ApplySlideTest(unittest.TestCase):
+    def test_apply_matches_slide_tiles(self):
+        for seed in range(200):
+            board = random_board(seed)
+            for _ in range(10):
+                slide = random_slide(board)
+                expected = board.slide_tiles(*slide)
+                board.apply_slide(*slide)
+                self.assertEqual(board, expected)
+                self.assertEqual(state(board), state(expected))
+                self.assertEqual(hash(board), hash(expected))
+                self.assertEqual(board._hash, board._tiles_hash())
+
+    def test_orientation_must_be_a_right_angle(self):
+        board = random_board(0)
+        slide = random_slide(board)[0]
+        for orientation in [1, 3, 45]:
+            self.assertRaises(AssertionError, board.slide_tiles, slide, orientation)
+        self.assertEqual(board.slide_tiles(slide, 360), board.slide_tiles(slide, 0))
+
+    def test_nested_undo_is_identity(self):
+        for seed in range(200):
+            board = random_board(seed)
+            before = board.clone()
+            states, tokens = [], []
+            for _ in range(random.randrange(1, 10)):
+                states.append(state(board))
+                tokens.append(board.apply_slide(*random_slide(board)))
+            while tokens:
+                board.undo(tokens.pop())
+                self.assertEqual(state(board), states.pop())
+                self.assertEqual(board._hash, board._tiles_hash())
+            self.assertEqual(board, before)
+            self.assertEqual(hash(board), hash(before))
+
+def partition(labels):
+    """Component labels renumbered in order of first appearance, so equal partitions compare equal"""
+    numbers = {}
+    return [numbers.setdefault(label, len(numbers)) for label in labels]
+
+class ComponentsTest(unittest.TestCase):
+    def assertCurrent(self, board):
+        fresh = board.clone()
+        fresh._components = None
+        self.assertEqual(partition(board.components), partition(fresh.components))
+
+    def test_labels_match_recompute(self):
+        for seed in range(200):
+            board = random_board(seed)
+            board.components
+            tokens = []
+            for _ in range(30):
+                tokens.append(board.apply_slide(*random_slide(board)))
+                # Sometimes make several slides before the labels are asked for, undo puts back
+                # the labels of the board it returns to
+                if random.random() < 0.7:
+                    self.assertCurrent(board)
+                if random.random() < 0.3:
+                    board.undo(tokens.pop())
+                    self.assertCurrent(board)
+            while tokens:
+                board.undo(tokens.pop())
+                self.assertCurrent(board)
+
+if __name__ == '__main__':
+    unittest.main()
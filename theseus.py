@@ -1,8 +1,27 @@
 from Labyrinth.player import *
+from Labyrinth.tile import slide_actions, slide_action_index, destinations, destination_index
+from Labyrinth.board import token_names, token_ids, slide_lines, mask_planes
+import Labyrinth.instrument as instrument
+import numpy as np
 import torch
+import time
+
+class SearchStats:
+    """Totals over every search of a Theseus, shared with the clones the board makes of it"""
+    def __init__(self):
+        self.nodes = 0
+        self.seconds = 0.0
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.seconds if self.seconds else 0.0
 
 class Theseus(Player):
-    def __init__(self, colour, network, device, exploration_weight=0.1, data_bank=[], iterations=1000):
+    # Taken off the value of every node on the path to a leaf waiting in a batch, so the
+    # rest of the batch is steered elsewhere
+    VIRTUAL_LOSS = 1.0
+
+    def __init__(self, colour, network, device, exploration_weight=0.1, data_bank=[], iterations=1000, batch_size=1):
         super().__init__(colour)
         self.network = network
         self.exploration_weight = exploration_weight
@@ -10,6 +29,13 @@ class Theseus(Player):
         self.data_bank = data_bank
         self.device = device
         self.iterations = iterations
+        assert(batch_size >= 1)
+        self.batch_size = batch_size
+        self.search_stats = SearchStats()
+
+    @property
+    def nodes_per_second(self):
+        return self.search_stats.nodes_per_second
 
     def decide_move(self, gameboard):
         assert(all(hasattr(self, a) for a in ["home_x", "home_y", "x", "y"]))
@@ -21,13 +47,14 @@ class Theseus(Player):
         tensor = convert_gameboard_to_tensor(gameboard, self.cards, self.colour)
 
         # Slide space search
-        pi_max, pi_slide = self._search_slide_space(gameboard.clone(), self.iterations)
+        pi_max, pi_slide = self._search_slide_space(gameboard.clone(), self.iterations, tensor)
         direction, orientation = pi_max
 
         new_board = gameboard.slide_tiles(direction, orientation)
 
         # Move space search
-        destination, pi_move = self._search_move_space(new_board.clone(), self.iterations)
+        destination, pi_move = self._search_move_space(new_board.clone(), self.iterations,
+                                                       slid_tensor(tensor, new_board, self.cards, self.colour, direction))
         
         # Smart Path
         path = self._smart_path(destination, new_board)
@@ -37,15 +64,10 @@ class Theseus(Player):
 
         return direction, orientation, path
     
-    def _search_slide_space(self, initial_state, iterations):
-        root = SlideNode(self.network, self.device, self.cards, self.colour, self.cards, self.colour, initial_state)
-
-        for _ in range(iterations):
-            node = None
-            while not node:
-                node = self._select(root)
-            reward = node.value
-            self._backpropagate(node, reward)
+    def _search_slide_space(self, initial_state, iterations, tensor=None):
+        root = SlideNode(self.network, self.device, self.cards, self.colour, self.cards, self.colour, initial_state,
+                         tensor=tensor)
+        self._search(root, iterations)
 
         pi = root.generate_pi(self.exploration_weight)
 
@@ -59,24 +81,61 @@ class Theseus(Player):
             pi_max = sorted_children[1]
         return pi_max.action, pi
     
-    def _search_move_space(self, initial_state, iterations):
-        root = MoveNode(self.network, self.device, self.cards, self.colour, self.cards, self.colour, initial_state)
-
-        for _ in range(iterations):
-            node = None
-            while not node:
-                node = self._select(root)
-            reward = node.value
-            self._backpropagate(node, reward)
+    def _search_move_space(self, initial_state, iterations, tensor=None):
+        root = MoveNode(self.network, self.device, self.cards, self.colour, self.cards, self.colour, initial_state,
+                        tensor=tensor)
+        self._search(root, iterations)
 
         pi = root.generate_pi(self.exploration_weight)
 
         pi_max = torch.argmax(pi).item()
         return (pi_max % 7, pi_max // 7), pi
 
+    def _search(self, root, iterations):
+        """Grow the tree by iterations leaves, evaluating up to batch_size of them per forward pass
+
+        Leaves wait in the batch with a virtual loss on their path, a batch is cut short when
+        the selection comes back to one of them. With a batch size of 1 this is plain MCTS."""
+        start = time.time()
+        evaluate_nodes(self.network, [root])
+        evaluated = 1
+
+        searched = 0
+        while searched < iterations:
+            batch = []
+            while len(batch) < min(self.batch_size, iterations - searched):
+                node = None
+                while not node:
+                    node = self._select(root)
+                if node in batch:
+                    break
+                batch.append(node)
+                self._add_virtual_loss(node, 1)
+
+            evaluate_nodes(self.network, batch)
+            for node in batch:
+                self._add_virtual_loss(node, -1)
+            for node in batch:
+                reward = node.value
+                self._backpropagate(node, reward)
+            searched += len(batch)
+            evaluated += len(batch)
+
+        self.search_stats.nodes += evaluated
+        self.search_stats.seconds += time.time() - start
+        instrument.count("nodes", evaluated)
+
+    def _add_virtual_loss(self, node, sign):
+        while node is not None:
+            node.visits += sign
+            node.value -= sign * self.VIRTUAL_LOSS
+            node = node.parent
+
     def _select(self, node):
         """Select a node to expand."""
         while 1:
+            if node.pending:
+                return node # Still waiting to be evaluated in this batch
             if not node.is_fully_expanded():
                 return node.expand()
             else:
@@ -95,54 +154,33 @@ class Theseus(Player):
         player = new_board.players[new_board.turn]
         player_start = (player.x, player.y)
 
-        targets = []
-        if player.cards == []:
-            targets = [(player.home_x, player.home_y)]
-        else:
-            num_cards = len(player.cards)
-            for i in range(num_cards):
-                card_loc = new_board.find_card(player.cards[i])
-                if card_loc:
-                    targets.append(card_loc)
+        targets = self._targets(new_board, player)
         
         if len(targets) == 0:
-            _, path = new_board.shortest_path_to_closest((end_x, end_y), destination)
+            _, path = new_board.shortest_path_to_closest(player_start, destination)
             return path
 
-        target_x, target_y = targets[0]
         # Try to calculate the shortest path to first card
-        (end_x, end_y), path = new_board.shortest_path_to_closest(player_start, targets[0])
+        end, path, reached = self._chain_path(new_board, player_start, targets[:1])
 
-        # Calculate how good the move is
-        score = abs(end_x - target_x) + abs(end_y - target_y)
-
-        if score == 0:
+        if reached:
             if player.cards == []:
                 return path
             # Made it to the first card, should try to get to the next one
-            keep_chaining = True
-            target_index = 1
-            while keep_chaining and target_index <= len(targets):
-                (start_x, start_y) = (end_x, end_y)
-                if target_index < len(targets):
-                    target_x, target_y = targets[target_index]
-                else:
-                    target_x, target_y = (player.home_x, player.home_y)
-                (end_x, end_y), path2 = new_board.shortest_path_to_closest((start_x, start_y), (target_x, target_y))
-                path += path2
-                keep_chaining = end_x == target_x and end_y == target_y
-                target_index += 1
-            if keep_chaining:
+            end, path2, reached = self._chain_path(new_board, end, targets[1:] + [(player.home_x, player.home_y)])
+            path += path2
+            if reached:
                 return path
             
-        _, path2 = new_board.shortest_path_to_closest((end_x, end_y), destination)
+        _, path2 = new_board.shortest_path_to_closest(end, destination)
         path += path2
 
         return path
 
 
 class MoveNode:
-    def __init__(self, network, device, cards, colour, org_cards, org_colour, state, destination=None, probability=0, parent=None):
+    def __init__(self, network, device, cards, colour, org_cards, org_colour, state, destination=None, probability=0, parent=None,
+                 tensor=None):
         self.state = state
         self.parent = parent
         self.children = []
@@ -156,16 +194,20 @@ class MoveNode:
         self.org_cards = org_cards
         self.org_colour = org_colour
 
-        tensor = convert_gameboard_to_tensor(state, cards, colour) # .to(device)
-        _, m, y = self.network(tensor.unsqueeze(0), slide=False)
-        self.m_logits = self._convert_tensor_to_probabilities(m.squeeze(0))
-
-        if colour == org_colour:
-            self.value = y.item()
-        else:
-            new_tensor = convert_gameboard_to_tensor(state, org_cards, org_colour) # .to(device)
-            _, _, y = self.network(new_tensor.unsqueeze(0), slide=False, move=False)
-            self.value = y.item()
+        if tensor is None:
+            tensor = convert_gameboard_to_tensor(state, cards, colour) # .to(device)
+        self.tensor = tensor
+        # The value is always from the original player's point of view
+        self.value_tensor = None if colour == org_colour else perspective_tensor(tensor, state, org_cards, org_colour)
+        # Nodes are evaluated after they are made, see evaluate_nodes
+        self.pending = True
+        self.m_logits = None
+        self.value = 0
+
+    def evaluate(self, p, m, y):
+        self.m_logits = self._convert_tensor_to_probabilities(m)
+        self.value += y
+        self.pending = False
 
     def is_fully_expanded(self):
         return len(self.m_logits) <= 0
@@ -193,8 +235,10 @@ class MoveNode:
             # Increment color 
             next_colour = all_player_colours[(all_player_colours.index(self.colour) + 1) % len(all_player_colours)]
             
+            # Only the moved player differs from this board, so the child's planes are patched from ours
+            next_tensor = perspective_tensor(self.tensor, next_state, next_cards, next_colour)
             child_node = MoveNode(self.network, self.device, next_cards, next_colour, self.org_cards, self.org_colour, next_state, 
-                                   destination=action, probability=highest_prob, parent=self)
+                                   destination=action, probability=highest_prob, parent=self, tensor=next_tensor)
             self.children.append(child_node)
             return child_node
         return None
@@ -203,22 +247,22 @@ class MoveNode:
         pi = torch.zeros(49)
 
         for child in self.children:
-            pi[child.destination[0] + (7 * child.destination[1])] = child.visits**(1/exploration_weight)
+            pi[destination_index[child.destination]] = child.visits**(1/exploration_weight)
 
         return pi / pi.sum()
     
     def _convert_tensor_to_probabilities(self, logits):
         """Converts probability distribution of all moves dictionary."""
 
-        probability_dist = {logits[i + (7 * j)].item(): tuple([i, j])
-                            for i in range(7) 
-                            for j in range(7)}
+        probability_dist = {probability: destination
+                            for probability, destination in zip(logits.tolist(), destinations)}
 
         return probability_dist
     
 
 class SlideNode:
-    def __init__(self, network, device, cards, colour, org_cards, org_colour, state, action=None, probability=0, parent=None):
+    def __init__(self, network, device, cards, colour, org_cards, org_colour, state, action=None, probability=0, parent=None,
+                 tensor=None):
         self.state = state
         self.parent = parent
         self.children = []
@@ -232,19 +276,25 @@ class SlideNode:
         self.org_cards = org_cards
         self.org_colour = org_colour
 
-        tensor = convert_gameboard_to_tensor(state, cards, colour) # .to(device)
-        p, m, y = self.network(tensor.unsqueeze(0))
-
-        self.p_logits = self._convert_tensor_to_probabilities(p.squeeze(0))
-
-        if colour == org_colour:
-            self.value = y.item()
-        else:
-            new_tensor = convert_gameboard_to_tensor(state, org_cards, org_colour) # .to(device)
-            _, _, y = self.network(new_tensor.unsqueeze(0), slide=False, move=False)
-            self.value = y.item()
-
-        self.destination = torch.argmax(m.squeeze(0))
+        if tensor is None:
+            tensor = convert_gameboard_to_tensor(state, cards, colour) # .to(device)
+        self.tensor = tensor
+        # The value is always from the original player's point of view
+        self.value_tensor = None if colour == org_colour else perspective_tensor(tensor, state, org_cards, org_colour)
+        # Nodes are evaluated after they are made, see evaluate_nodes
+        self.pending = True
+        self.p_logits = None
+        self.destination = None
+        self.value = 0
+
+        # Actions that lead to the same board are expanded once, as the most likely of them
+        self.equivalent_actions = {action: group for group in state.slide_classes() for action in group}
+
+    def evaluate(self, p, m, y):
+        self.p_logits = self._convert_tensor_to_probabilities(p)
+        self.destination = torch.argmax(m)
+        self.value += y
+        self.pending = False
 
     def is_fully_expanded(self):
         return len(self.p_logits) <= 0
@@ -263,6 +313,9 @@ class SlideNode:
         highest_prob = max(self.p_logits)
         action = self.p_logits.pop(highest_prob)
         if action:
+            equivalent = self.equivalent_actions.get(action, [action])
+            self.p_logits = {probability: other for probability, other in self.p_logits.items()
+                             if other not in equivalent}
             if self.state.last_slide == action[0]:
                 return None
             next_state = self.state.slide_tiles(action[0], action[1])
@@ -274,8 +327,10 @@ class SlideNode:
             # Increment color 
             next_colour = all_player_colours[(all_player_colours.index(self.colour) + 1) % len(all_player_colours)]
             
+            # Only the slid line and the floating tile differ from this board
+            next_tensor = slid_tensor(self.tensor, next_state, next_cards, next_colour, action[0])
             child_node = SlideNode(self.network, self.device, next_cards, next_colour, self.org_cards, self.org_colour, next_state, 
-                                   action=action, probability=highest_prob, parent=self)
+                                   action=action, probability=highest_prob, parent=self, tensor=next_tensor)
             self.children.append(child_node)
             return child_node
         return None
@@ -284,80 +339,126 @@ class SlideNode:
         pi = torch.zeros(48)
 
         for child in self.children:
-            actions = TileMovement.all_moves()
-            orientations = [0, 90, 180, 270]
-
-            direction_index = actions.index(child.action[0])
-            orientation_index = orientations.index(child.action[1])
-
-            pi[direction_index + (orientation_index * 12)] = child.visits**(1/exploration_weight)
+            # Share the visits out over every action that leads to the same board
+            equivalent = self.equivalent_actions[child.action]
+            for action in equivalent:
+                pi[slide_action_index[action]] = child.visits**(1/exploration_weight) / len(equivalent)
 
         return pi / pi.sum()
     
     def _convert_tensor_to_probabilities(self, logits):
         """Converts probability distribution of all moves dictionary."""
-        actions = TileMovement.all_moves()
-        orientations = [0, 90, 180, 270]
-
-        probability_dist = {logits[i + (j * 12)].item(): tuple([actions[i], orientations[j]]) 
-                            for i in range(12) 
-                            for j in range(4)}
+        probability_dist = {probability: action
+                            for probability, action in zip(logits.tolist(), slide_actions)}
 
         return probability_dist
     
 
+def evaluate_nodes(network, nodes):
+    """Evaluate new nodes of one kind together in one forward pass
+
+    Nodes seen from another player also need their value from the original player's point
+    of view, those tensors go in the same batch. A network with trunk(x) and
+    heads(features, slide, move) methods only runs the heads it needs on each part."""
+    if not nodes:
+        return
+    slide = isinstance(nodes[0], SlideNode)
+    others = [i for i, node in enumerate(nodes) if node.value_tensor is not None]
+    tensors = torch.stack([node.tensor for node in nodes] + [nodes[i].value_tensor for i in others])
+    instrument.count("network")
+
+    if hasattr(network, "trunk") and hasattr(network, "heads"):
+        features = network.trunk(tensors)
+        p, m, y = network.heads(features[:len(nodes)], slide=slide, move=True)
+        values = y.reshape(-1).tolist()
+        if others:
+            _, _, y = network.heads(features[len(nodes):], slide=False, move=False)
+            values += y.reshape(-1).tolist()
+    else:
+        p, m, y = network(tensors, slide=slide)
+        values = y.reshape(-1).tolist()
+
+    for i, value in zip(others, values[len(nodes):]):
+        values[i] = value
+    for i, node in enumerate(nodes):
+        node.evaluate(p[i] if slide else None, m[i], values[i])
+
+
 card_list = ["genie", "skull", "sword", "scarab", "beetle", "rat",
             "dragonfly", "gold", "keys", "gem", "lizard", "helmet",
             "princess", "book", "crown", "treasure", "candlestick",
             "ghost", "spider", "owl", "map", "ring", "man", "bat"]
 
+slide_cells = {direction: np.array(line) for direction, line in slide_lines.items()}
+card_tokens = {} # First card -> which token ids show on the card plane, see card_token_row
+
+def card_token_row(card):
+    """Token ids matched by a card, a token matches when its name is part of the card's"""
+    if card not in card_tokens:
+        card_tokens[card] = np.array([name is not None and name in card for name in token_names])
+    return card_tokens[card]
+
 def convert_gameboard_to_tensor(gameboard, cards, colour):
         """Convert game state to tensor for input into network."""
-        def check_tile(tile):
-            north = 0
-            east = 0
-            south = 0
-            west = 0
-            token = 0
-            home = 0
-            if cards != []:
-                if tile.token is not None and tile.token in cards[0]:
-                    token = 1
-            if tile.token == str(colour) + " base":
-                home = 1
-            if tile.NORTH == True:
-                north = 1
-            if tile.EAST == True:
-                east = 1
-            if tile.SOUTH == True:
-                south = 1
-            if tile.WEST == True:
-                west = 1
-            return north, east, south, west, token, home
-            
-        state_tensor = torch.zeros(12, 7, 7) #player location, paths 4, is card, is home
-
-        # Set player location information
+        return convert_gameboards_to_tensor([gameboard], [cards], [colour])[0]
+
+def convert_gameboards_to_tensor(gameboards, cards, colours):
+        """Convert B game states, each with its own cards and colour, to a (B, 12, 7, 7) tensor
+
+        Channels are the player location, the four paths, is card, is home and the floating
+        tile's four paths and card. The player plane is indexed [x, y], the rest [row, column]."""
+        n = len(gameboards)
+        edges = np.frombuffer(b"".join(bytes(board._edges) for board in gameboards), dtype=np.uint8).reshape(n, 50)
+        tokens = np.frombuffer(b"".join(bytes(board._tokens) for board in gameboards), dtype=np.uint8).reshape(n, 50)
+        state = np.zeros((n, 12, 50), dtype=np.float32)
+
+        # Paths of the board and of the floating tile (cell 49) on every square
+        paths = mask_planes(edges).transpose(1, 0, 2)
+        state[:, 1:5, :49] = paths[:, :, :49]
+        state[:, 7:11, :49] = paths[:, :, 49:]
+
+        # Tiles showing the first card, and the player's home
+        shown = np.array([card_token_row(c[0]) if c != [] else np.zeros(len(token_names), dtype=bool) for c in cards])
+        on_card = np.take_along_axis(shown, tokens, axis=1)
+        state[:, 5, :49] = on_card[:, :49]
+        state[:, 11, :49] = on_card[:, 49:]
+        homes = np.array([token_ids.get(str(colour) + " base", -1) for colour in colours])
+        state[:, 6, :49] = tokens[:, :49] == homes[:, None]
+
+        # Player location, indexed [x, y]
+        for i, (gameboard, colour) in enumerate(zip(gameboards, colours)):
+            for player in gameboard.players:
+                if player.colour == colour:
+                    state[i, 0, player.x * 7 + player.y] = 1
+
+        return torch.from_numpy(np.ascontiguousarray(state[:, :, :49]).reshape(n, 12, 7, 7))
+
+def perspective_tensor(tensor, gameboard, cards, colour):
+        """The observation of gameboard for other cards and colour, from a tensor of the same tiles
+
+        Only the player, card and home planes depend on who is looking, so only they are redone."""
+        state = tensor.clone()
+        flat = state.numpy().reshape(12, 49)
+        tokens = np.frombuffer(gameboard._tokens, dtype=np.uint8)
+        shown = card_token_row(cards[0]) if cards != [] else np.zeros(len(token_names), dtype=bool)
+        flat[5] = shown[tokens[:49]]
+        flat[6] = tokens[:49] == token_ids.get(str(colour) + " base", -1)
+        flat[11] = shown[tokens[49]]
+
+        flat[0] = 0
         for player in gameboard.players:
             if player.colour == colour:
-                state_tensor[0, player.x, player.y] = 1
-
-        float_north, float_east, float_south, float_west, float_token, _ = check_tile(gameboard.floating_tile)
-
-        # set board info
-        for x in range(7):
-            for y in range(7):
-                north, east, south, west, token, base = check_tile(gameboard._board[x][y])
-                state_tensor[1, x, y] = north
-                state_tensor[2, x, y] = east
-                state_tensor[3, x, y] = south
-                state_tensor[4, x, y] = west
-                state_tensor[5, x, y] = token
-                state_tensor[6, x, y] = base
-                state_tensor[7, x, y] = float_north
-                state_tensor[8, x, y] = float_east
-                state_tensor[9, x, y] = float_south
-                state_tensor[10, x, y] = float_west
-                state_tensor[11, x, y] = float_token
-
-        return state_tensor
\ No newline at end of file
+                flat[0, player.x * 7 + player.y] = 1
+        return state
+
+def slid_tensor(tensor, gameboard, cards, colour, direction):
+        """The observation of gameboard from a tensor of the board before direction was slid
+
+        The path planes are redone along the slid line and for the floating tile."""
+        state = perspective_tensor(tensor, gameboard, cards, colour)
+        flat = state.numpy().reshape(12, 49)
+        edges = np.frombuffer(gameboard._edges, dtype=np.uint8)
+        line = slide_cells[direction]
+        flat[1:5, line] = mask_planes(edges[line])
+        flat[7:11] = mask_planes(edges[49])[:, None]
+        return state
\ No newline at end of file
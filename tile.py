@@ -4,8 +4,39 @@ import random
 import math
 import Labyrinth.utils as utils
 
-global tile_id
-tile_id = 0
+# Edge bits used by the compact board representation
+NORTH_BIT = 1
+EAST_BIT = 2
+SOUTH_BIT = 4
+WEST_BIT = 8
+
+def rotate_mask(mask, angle=90):
+    # angle is clockwise and must be a multiple of 90 degrees
+    angle = int(angle) % 360
+    assert(angle in [0, 90, 180, 270])
+    steps = angle // 90
+    return ((mask << steps) | (mask >> (4 - steps))) & 0xF
+
+# Edge mask after a further clockwise rotation, indexed [mask][angle / 90]
+rotated_masks = [bytes(rotate_mask(mask, angle) for angle in [0, 90, 180, 270]) for mask in range(16)]
+
+# Tile shapes and their edge mask at rotation 0. A (shape, rotation) pair is stored as a
+# single shape_rotation index of shape * 4 + rotation / 90
+NO_SHAPE = 0
+CORNER = 1
+STRAIGHT = 2
+TRI = 3
+shape_edges = [0, NORTH_BIT | EAST_BIT, EAST_BIT | WEST_BIT, NORTH_BIT | EAST_BIT | WEST_BIT]
+shape_rotation_edges = bytes(rotate_mask(edges, angle) for edges in shape_edges for angle in [0, 90, 180, 270])
+
+# shape_rotation index after a further clockwise rotation, indexed [index][angle / 90]
+shape_rotations = [bytes(index - index % 4 + (index + quarters) % 4 for quarters in range(4))
+                   for index in range(len(shape_rotation_edges))]
+
+# shape_rotation index of an edge mask, symmetric shapes use their lowest rotation
+mask_shape_rotation = {}
+for index in reversed(range(len(shape_rotation_edges))):
+    mask_shape_rotation[shape_rotation_edges[index]] = index
 
 class TileMovement: # Represent as (Edge, Row) i.e. (T, M) for Top Middle
     # WARNING: Chaning these values will break the offset in the slide_tiles function
@@ -42,19 +73,7 @@ class TileMovement: # Represent as (Edge, Row) i.e. (T, M) for Top Middle
 
     @classmethod
     def all_moves(cls):
-        l = [ (cls.T, cls.L)
-            , (cls.T, cls.M)
-            , (cls.T, cls.R)
-            , (cls.B, cls.L)
-            , (cls.B, cls.M)
-            , (cls.B, cls.R)
-            , (cls.L, cls.T)
-            , (cls.L, cls.M)
-            , (cls.L, cls.B)
-            , (cls.R, cls.T)
-            , (cls.R, cls.M)
-            , (cls.R, cls.B)
-            ]
+        l = list(slide_moves)
         random.shuffle(l)
         return l
 
@@ -118,47 +137,112 @@ class TileMovement: # Represent as (Edge, Row) i.e. (T, M) for Top Middle
         return "{} {}".format(side_cls, row_cls)
 
 
+# Canonical order of the slides and actions, used for the network's policy layout. The
+# slide policy index is slide + 12 * orientation and the move policy index is x + 7 * y
+slide_moves = [ (TileMovement.T, TileMovement.L)
+              , (TileMovement.T, TileMovement.M)
+              , (TileMovement.T, TileMovement.R)
+              , (TileMovement.B, TileMovement.L)
+              , (TileMovement.B, TileMovement.M)
+              , (TileMovement.B, TileMovement.R)
+              , (TileMovement.L, TileMovement.T)
+              , (TileMovement.L, TileMovement.M)
+              , (TileMovement.L, TileMovement.B)
+              , (TileMovement.R, TileMovement.T)
+              , (TileMovement.R, TileMovement.M)
+              , (TileMovement.R, TileMovement.B)
+              ]
+orientations = [0, 90, 180, 270]
+slide_actions = [(slide, orientation) for orientation in orientations for slide in slide_moves]
+slide_action_index = {action: index for index, action in enumerate(slide_actions)}
+destinations = [(x, y) for y in range(7) for x in range(7)]
+destination_index = {destination: index for index, destination in enumerate(destinations)}
+
+def orientation_classes(mask):
+    """Group the orientations that turn mask into the same edges, a straight tile only has two"""
+    classes = {}
+    for orientation in orientations:
+        classes.setdefault(rotated_masks[mask][orientation // 90], []).append(orientation)
+    return list(classes.values())
+
+
 class Tile:
-    def __init__(self, rotation=0):
-        global tile_id
-        # Unique ID for each tile
-        self.id = tile_id
-        tile_id += 1
+    """A tile is just a shape_rotation index, a token and whether it can move"""
+    SHAPE = NO_SHAPE
+    # Frozen tiles are shared between boards and can't be changed, see freeze
+    _frozen = False
 
+    def __init__(self, rotation=0):
         # Colour the tile should be when printing
         self._colours = []
 
-        self.NORTH = False
-        self.EAST = False
-        self.SOUTH = False
-        self.WEST = False
+        self._shape_rotation = self.SHAPE * 4
         self.token = None
         self.can_move = True
         self.rotate(rotation)
 
+    @property
+    def NORTH(self):
+        return bool(shape_rotation_edges[self._shape_rotation] & NORTH_BIT)
+
+    @property
+    def EAST(self):
+        return bool(shape_rotation_edges[self._shape_rotation] & EAST_BIT)
+
+    @property
+    def SOUTH(self):
+        return bool(shape_rotation_edges[self._shape_rotation] & SOUTH_BIT)
+
+    @property
+    def WEST(self):
+        return bool(shape_rotation_edges[self._shape_rotation] & WEST_BIT)
+
     def rotate(self, angle=90):
         # angle is clockwise and must be a multiple of 90 degrees
         angle = int(angle) % 360
         assert(angle in [0, 90, 180, 270])
         assert(self.can_move)
-        while angle > 0:
-            tmp = self.NORTH
-            self.NORTH = self.WEST
-            self.WEST = self.SOUTH
-            self.SOUTH = self.EAST
-            self.EAST = tmp
-            angle -= 90
+        self._shape_rotation = shape_rotations[self._shape_rotation][angle // 90]
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError("tile is shared between boards and can't be changed")
+        object.__setattr__(self, name, value)
+
+    def freeze(self):
+        """Make the tile read only, for tiles shared between boards"""
+        object.__setattr__(self, "_frozen", True)
+        return self
+
+    def edge_mask(self):
+        return shape_rotation_edges[self._shape_rotation]
+
+    @classmethod
+    def from_edge_mask(cls, mask, token=None, can_move=True):
+        """Build a standalone tile from a compact edge mask"""
+        shape_rotation = mask_shape_rotation[mask]
+        tile_type = tile_types[shape_rotation // 4]
+        tile = tile_type.__new__(tile_type)
+        tile._colours = []
+        tile._shape_rotation = shape_rotation
+        tile.token = token
+        tile.can_move = can_move
+        return tile
 
     def __str__(self):
+        return self.draw(self._colours)
+
+    def draw(self, colours):
+        """Draw the tile, splitting it between the colours of any players on it"""
         token = (self.token if self.token else "")
         token = token.ljust(15) if len(token) > 5 else token.center(15)
 
-        if "red" in self._colours and not utils.SHOW_COLOURS:
+        if "red" in colours and not utils.SHOW_COLOURS:
             path = "R"
         else:
             path = "┌" if self.can_move else "X"
         path += ("┐     ┌" if self.NORTH else "───────")
-        if "blue" in self._colours and not utils.SHOW_COLOURS:
+        if "blue" in colours and not utils.SHOW_COLOURS:
             path += "B\n"
         else:
             path += ("┐\n" if self.can_move else "X\n")
@@ -175,20 +259,20 @@ class Tile:
         path += " %s " % token[10:15]
         path += "┐\n" if self.EAST else "│\n"
 
-        if "yellow" in self._colours and not utils.SHOW_COLOURS:
+        if "yellow" in colours and not utils.SHOW_COLOURS:
             path += "Y"
         else:
             path += "└" if self.can_move else "X"
         path += "┘     └" if self.SOUTH else "───────"
-        if "green" in self._colours and not utils.SHOW_COLOURS:
+        if "green" in colours and not utils.SHOW_COLOURS:
             path += "G"
         else:
             path += "┘" if self.can_move else "X"
 
-        if self._colours:
-            gap = math.ceil(len(path) / len(self._colours))
-            split_path = [path[i*gap:(i+1)*gap] for i in range(len(self._colours))]
-            for i, c in enumerate(self._colours):
+        if colours:
+            gap = math.ceil(len(path) / len(colours))
+            split_path = [path[i*gap:(i+1)*gap] for i in range(len(colours))]
+            for i, c in enumerate(colours):
                 split_path[i] = colourise(c, split_path[i])
             path = "".join(split_path)
         return path
@@ -196,23 +280,15 @@ class Tile:
     __repr__ = __str__
 
 class CornerTile(Tile):
-    def __init__(self, rotation=0):
-        Tile.__init__(self, rotation)
-        self.NORTH = True
-        self.EAST = True
+    SHAPE = CORNER
 
 class StraightTile(Tile):
-    def __init__(self, rotation=0):
-        Tile.__init__(self, rotation)
-        self.EAST = True
-        self.WEST = True
+    SHAPE = STRAIGHT
 
 class TriTile(Tile):
-    def __init__(self, rotation=0):
-        Tile.__init__(self, rotation)
-        self.EAST = True
-        self.NORTH = True
-        self.WEST = True
+    SHAPE = TRI
+
+tile_types = [Tile, CornerTile, StraightTile, TriTile]
 
 def batch_create_tiles(tile_type, number, tokens=[]):
     output = set()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""Play many headless games across a process pool, writing one record per game as they finish
+
+    python tournament.py --games 1000 --seats Player ExpectimaxPlayer --rule CARDS_IN_ORDER=no
+
+Seats are player classes that take just a colour, either one of player_classes or a
+"module:Class" path. Game i is seeded with seed + i, so a record can be replayed on its own."""
+from Labyrinth.labyrinth import *
+from Labyrinth.instrument import Instrumentation
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+import argparse, csv, importlib, json, os, random, sys, time
+
+player_classes = {
+    "Player": "Labyrinth.player:Player",
+    "ExpectimaxPlayer": "Labyrinth.expectimax:ExpectimaxPlayer",
+}
+
+def load_class(name):
+    module, _, cls = player_classes.get(name, name).partition(":")
+    return getattr(importlib.import_module(module), cls)
+
+def make_ruleset(rules):
+    """A RuleSet with some rules changed, rules maps names to strings like the configure prompts"""
+    ruleset = RuleSet()
+    for name, value in rules.items():
+        default = getattr(ruleset, name)
+        if isinstance(default, bool):
+            value = str_bool(value)
+            assert(value is not None)
+        else:
+            value = int(value)
+        setattr(ruleset, name, value)
+    return ruleset
+
+def play_game(game, seed, seats, rules, max_turns, profile=False):
+    """Play one game to the end, or max_turns, and describe how it went
+
+    With profile the record also has the Instrumentation snapshot of the game as "stats"."""
+    start = time.time()
+    random.seed(seed)
+    players = [load_class(seat)(colour) for seat, colour in zip(seats, all_player_colours)]
+    lab = Labyrinth(make_ruleset(rules), players)
+    instrumentation = Instrumentation() if profile else None
+    if profile:
+        instrumentation.attach(lab)
+
+    turns = 0
+    while not lab.is_over() and turns < max_turns:
+        lab.make_turn()
+        turns += 1
+    if profile:
+        instrumentation.close()
+
+    winner = lab.who_won()
+    players = lab.gameboard.players
+    record = {
+        "game": game,
+        "seed": seed,
+        "winner": None if winner is None else players.index(winner),
+        "winner_colour": None if winner is None else winner.colour,
+        "turns": turns,
+        "end": lab.end_reason or ("won" if winner is not None else "turn limit"),
+        "cards": [len(p.cards) for p in players],
+        "seconds": round(time.time() - start, 4),
+    }
+    if profile:
+        record["stats"] = instrumentation.snapshot()
+    return record
+
+def run_tournament(games, seats, rules={}, seed=0, max_turns=1000, workers=None, profile=False):
+    """Yield the game records in the order they finish, only a few games are queued at a time"""
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        for game in range(games):
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(play_game, game, seed + game, seats, rules, max_turns, profile))
+        for future in as_completed(pending):
+            yield future.result()
+
+class RecordWriter:
+    """Writes game records as JSON lines, or as CSV with one cards column per seat"""
+    def __init__(self, stream, seats, format="jsonl"):
+        self.stream = stream
+        self.csv = None
+        if format == "csv":
+            fields = ["game", "seed", "winner", "winner_colour", "turns", "end"]
+            fields += ["cards_{}".format(seat) for seat in range(seats)] + ["seconds"]
+            self.csv = csv.DictWriter(stream, fields)
+            self.csv.writeheader()
+
+    def write(self, record):
+        if self.csv is None:
+            self.stream.write(json.dumps(record) + "\n")
+        else:
+            row = dict(record)
+            for seat, cards in enumerate(row.pop("cards")):
+                row["cards_{}".format(seat)] = cards
+            self.csv.writerow(row)
+        self.stream.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless Labyrinth games in parallel")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seats", nargs="+", default=["Player"] * len(all_player_colours),
+                        help="player class for each seat, 2 to 4 seats")
+    parser.add_argument("--rule", action="append", default=[], metavar="NAME=VALUE",
+                        help="change a RuleSet rule, booleans are yes/no")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--max-turns", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores")
+    parser.add_argument("--output", default="-", help="file to write to, - for stdout")
+    parser.add_argument("--profile", metavar="FILE", default=None,
+                        help="time the turns, writing the stats of all games to FILE as JSON and a summary to stderr")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None,
+                        help="defaults to csv for .csv outputs and jsonl otherwise")
+    args = parser.parse_args()
+
+    assert(2 <= len(args.seats) <= len(all_player_colours))
+    rules = dict(rule.split("=", 1) for rule in args.rule)
+    make_ruleset(rules) # Check the rules before starting any workers
+    format = args.format or ("csv" if args.output.endswith(".csv") else "jsonl")
+
+    instrumentation = Instrumentation()
+    stream = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        writer = RecordWriter(stream, len(args.seats), format)
+        for record in run_tournament(args.games, args.seats, rules, args.seed, args.max_turns, args.workers,
+                                     args.profile is not None):
+            if args.profile is not None:
+                instrumentation.merge(record.pop("stats"))
+            writer.write(record)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    if args.profile is not None:
+        with open(args.profile, "w") as profile:
+            profile.write(instrumentation.to_json())
+        print(instrumentation.summary(), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
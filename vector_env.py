@@ -0,0 +1,85 @@
+from Labyrinth.labyrinth import *
+from Labyrinth.theseus import convert_gameboards_to_tensor
+import torch
+
+class VectorLabyrinth:
+    """B independent self-play games stepped together with one action per game
+
+    Every seat is played by the actions, the observation of a game is from the point of
+    view of the player whose turn it is, in the convert_gameboard_to_tensor layout. An
+    action is (slide, orientation, destination) of indices into slide_moves, orientations
+    and destinations, as in slide_actions, and the player walks as close to the destination
+    as it can. The reward is 1 for the move that wins the game, adjudicated games (see RuleSet)
+    are done too and reward the mover if they were given the win. Finished games, and games
+    that reach max_turns, are reset straight away so the returned observation is of the new game.
+
+    Games are dealt from a random.Random of the env's own, with a seed the k-th game
+    started is dealt from random.Random(seed + k)."""
+    def __init__(self, n, ruleset=None, players=len(all_player_colours), seed=None, max_turns=1000):
+        self.ruleset = RuleSet() if ruleset is None else ruleset
+        self.players = players
+        self.seed = seed
+        self.max_turns = max_turns
+        self.started = 0
+        self._rng = random.Random()
+        self.games = [self._new_game() for _ in range(n)]
+        self.turns = [0] * n
+
+    def __len__(self):
+        return len(self.games)
+
+    def _new_game(self):
+        rng = self._rng if self.seed is None else random.Random(self.seed + self.started)
+        self.started += 1
+        return Labyrinth(self.ruleset, [Player(colour) for colour in all_player_colours[:self.players]], rng)
+
+    def reset(self):
+        """Start every game again, returns the observations"""
+        self.games = [self._new_game() for _ in self.games]
+        self.turns = [0] * len(self.games)
+        return self.observations()
+
+    def observations(self):
+        """(B, 12, 7, 7) tensor of the games from the point of view of the player to move"""
+        boards = [lab.gameboard for lab in self.games]
+        players = [board.players[board.turn] for board in boards]
+        return convert_gameboards_to_tensor(boards, [p.cards for p in players], [p.colour for p in players])
+
+    def legal_slides(self):
+        """(B, 48) mask of the slide actions, in slide_actions order, each game can make"""
+        mask = torch.ones(len(self.games), len(slide_actions), dtype=torch.bool)
+        for i, lab in enumerate(self.games):
+            for index, (slide, _) in enumerate(slide_actions):
+                if slide == lab.gameboard.last_slide:
+                    mask[i, index] = False
+        return mask
+
+    def step(self, actions):
+        """Play one action in each game, returns the observations, rewards and done flags"""
+        assert(len(actions) == len(self.games))
+        rewards = torch.zeros(len(self.games))
+        dones = torch.zeros(len(self.games), dtype=torch.bool)
+
+        for i, (slide, orientation, destination) in enumerate(actions):
+            assert(0 <= slide < len(slide_moves) and 0 <= orientation < len(orientations)
+                   and 0 <= destination < len(destinations))
+            lab = self.games[i]
+            direction = slide_moves[slide]
+            assert(direction != lab.gameboard.last_slide)
+
+            mover = lab.gameboard.players[lab.gameboard.turn].colour
+            lab.play_turn(direction, orientations[orientation], destination=destinations[destination])
+            self.turns[i] += 1
+
+            if lab.is_over():
+                winner = lab.who_won()
+                rewards[i] = winner is not None and winner.colour == mover
+                dones[i] = True
+            elif self.turns[i] >= self.max_turns:
+                dones[i] = True
+
+            if dones[i]:
+                self.games[i] = self._new_game()
+                self.turns[i] = 0
+
+        return self.observations(), rewards, dones